@@ -0,0 +1,20 @@
+# Generated by Django 2.2 on 2026-10-18 16:40
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_auto_20190412_2120'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['username'], name='account_user_username_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 
 class User(AbstractUser):
-    pass
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            GinIndex(fields=['username'], opclasses=['gin_trgm_ops'], name='account_user_username_trgm'),
+        ]
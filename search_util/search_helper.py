@@ -1,68 +1,214 @@
+import concurrent.futures
+import hashlib
 import re
-from django.contrib.postgres.search import SearchVector
-from django.db.models import Q
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Q
 
 from search_util.search_fields import *
 from tantalus.models import *
 
+# Number of results shown per category, and fetched per further page
+SEARCH_PAGE_SIZE = 20
+
+# Search result categories, with the group they are shown in and their model
+SEARCH_CATEGORIES = OrderedDict([
+    ("Patients", ("sample", Patient)),
+    ("Samples", ("sample", Sample)),
+    ("Submissions", ("analysis", Submission)),
+    ("Analyses", ("analysis", Analysis)),
+    ("Tags", ("analysis", Tag)),
+    ("Datasets", ("dataset", SequenceDataset)),
+    ("ResultDatasets", ("dataset", ResultsDataset)),
+])
+
+# Shared by all requests, so the number of concurrent category searches,
+# and of database connections they hold, is bounded across the process.
+# Sized so that each of the expected concurrent searches has a thread per
+# category, and categories do not queue behind each other.
+SEARCH_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=len(SEARCH_CATEGORIES) * settings.SEARCH_CONCURRENT_SEARCHES)
+
+
+def normalise_query(query):
+    """Strip a query and collapse its whitespace, which the search runs on and is cached by."""
+    return " ".join(query.split())
+
+
+def get_search_cache_key(query, generation, category=None, offset=0):
+    key = "search:{}:{}".format(generation, hashlib.sha1(query.encode("utf-8")).hexdigest())
+    if category is not None:
+        key += ":{}:{}".format(category, offset)
+    return key
+
+
 def return_text_search(query):
+    """
+    Search all categories for a query, serving repeated searches from the
+    search cache until the search documents next change. Results with
+    timed out categories are not cached.
+    """
+    query = normalise_query(query)
+
+    # Read before searching, so a change during the search invalidates it
+    cache_key = get_search_cache_key(query, get_search_generation())
+    context = caches["search"].get(cache_key)
+    if context is None:
+        context = search_all_categories(query)
+        if not context["timed_out"]:
+            caches["search"].set(cache_key, context)
+
+    return context
+
+
+def return_category_search(category, query, offset):
+    """
+    Search a further page of a category, with the same timeout and cache
+    as the first pages searched by return_text_search.
+    """
+    query = normalise_query(query)
+
+    cache_key = get_search_cache_key(query, get_search_generation(), category, offset)
+    result = caches["search"].get(cache_key)
+    if result is None:
+        result = search_categories([category], query, offset)[category]
+        if not result.get("timed_out"):
+            caches["search"].set(cache_key, result)
+
+    return result
+
+
+def search_all_categories(query):
     context = {
-        "sample": {
-            "Patients": [],
-            "Samples" : [],
-        },
-        "analysis": {
-            "Submissions" : [],
-            "Analyses": [],
-            "Tags" : []
-        },
-        "dataset": {
-            "Datasets": [],
-            "ResultDatasets": [],
-        },
+        "sample": OrderedDict(),
+        "analysis": OrderedDict(),
+        "dataset": OrderedDict(),
         "query" : query,
-        "total" : 0
+        "total" : 0,
+        "timed_out": [],
+    }
+
+    results = search_categories(SEARCH_CATEGORIES, query)
+
+    for category, (group, model) in SEARCH_CATEGORIES.items():
+        result = results[category]
+        context[group][category] = result
+        context["total"] += result["count"]
+        if result.get("timed_out"):
+            context["timed_out"].append(category)
+
+    return context
+
+
+def search_categories(categories, query, offset=0):
+    """
+    Search categories concurrently in the search executor, returning their
+    results by category, as timed out for those not done within the search
+    timeout. The timeout counts from the start of the search, including
+    time categories spend queued for a thread, so it bounds the whole search.
+    """
+    deadline = time.monotonic() + settings.SEARCH_TIMEOUT
+    futures = OrderedDict(
+        (category, SEARCH_EXECUTOR.submit(search_category_in_worker, category, query, offset, deadline))
+        for category in categories)
+
+    concurrent.futures.wait(futures.values(), timeout=settings.SEARCH_TIMEOUT)
+
+    results = {}
+    for category, future in futures.items():
+        if future.done():
+            results[category] = future.result()
+        else:
+            # Still queued categories never start, and running ones are
+            # ended by their statement timeout
+            future.cancel()
+            results[category] = timed_out_category()
+    return results
+
+
+def timed_out_category():
+    return {"results": [], "count": 0, "next_offset": None, "timed_out": True}
+
+
+def search_category_in_worker(category, query, offset, deadline):
+    """
+    Search a category in a search executor thread, on that thread's own
+    connection, with the time left until the deadline as statement timeout.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return timed_out_category()
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET LOCAL statement_timeout = %s",
+                    [max(int(remaining * 1000), 1)])
+            return search_category(category, query, offset=offset)
+    except OperationalError:
+        return timed_out_category()
+    finally:
+        # Executor threads outlive requests, so nothing else closes it
+        connection.close()
+
+
+def search_category(category, query, offset=0, limit=SEARCH_PAGE_SIZE):
+    """
+    Return a page of the objects of a category matching a query, best
+    ranked first, with the number of matches in the category.
+    """
+    group, model = SEARCH_CATEGORIES[category]
+    documents = SearchDocument.matching(model, query, extra_match=get_extra_match(model, query))
+
+    object_ids = list(
+        documents
+        .annotate(rank=SearchRank(F("search_vector"), SearchQuery(query)))
+        .order_by("-rank", "object_id")
+        .values_list("object_id", flat=True)[offset:offset + limit])
+    objects = model.objects.in_bulk(object_ids)
+
+    count = documents.count()
+
+    # Rendered here, so results can be cached and served as JSON
+    return {
+        "results": [
+            {"name": str(objects[pk]), "url": objects[pk].get_absolute_url()}
+            for pk in object_ids if pk in objects
+        ],
+        "count": count,
+        "next_offset": offset + limit if offset + limit < count else None,
     }
 
-    context["sample"]["Patients"].extend(list(Patient.objects.annotate(search=SearchVector(*PATIENT)).filter(Q(search=query) | Q(search__icontains=query))))
-    context["sample"]["Samples"].extend(list(Sample.objects.annotate(search=SearchVector(*SAMPLE)).filter(Q(search=query) | Q(search__icontains=query))))
-    context["dataset"]["Datasets"].extend(list(SequenceDataset.objects.annotate(search=SearchVector(*(SEQUENCE_DATASET))).filter(Q(search=query) | Q(search__icontains=query))))
 
-    context["analysis"]["Submissions"].extend(list(Submission.objects.annotate(search=SearchVector(*(SUBMISSION))).filter(Q(search=query) | Q(search__icontains=query))))
-    context["dataset"]["ResultDatasets"].extend(list(ResultsDataset.objects.annotate(search=SearchVector(*RESULT_DATASET)).filter(Q(search=query) | Q(search__icontains=query))))
-    context["analysis"]["Analyses"].extend(list(Analysis.objects.annotate(search=SearchVector(*(ANALYSIS))).filter(Q(search=query) | Q(search__icontains=query))))
-    context["analysis"]["Tags"].extend(list(Tag.objects.annotate(search=SearchVector(*(TAG))).filter(Q(search=query) | Q(search__icontains=query))))
+def get_extra_match(model, query):
+    """
+    Match sequence datasets by the sequencing centre or dataset type whose
+    description contains the query, as the documents only hold the codes.
+    """
+    if model is not SequenceDataset:
+        return None
 
     dict_sequencing_centre = dict((y, x) for x, y in SEQUENCING_CENTRE)
     dict_dataset_type = dict((y, x) for x, y in DATASET_TYPE)
 
-    if partial_key_match(query, dict_sequencing_centre):
-        context["dataset"]["Datasets"].extend(list(SequenceDataset.objects.filter(sequence_lane__sequencing_centre=partial_key_match(query, dict_sequencing_centre))))
-    if partial_key_match(query, dict_dataset_type):
-        context["dataset"]["Datasets"].extend(list(SequenceDataset.objects.filter(dataset_type=partial_key_match(query, dict_dataset_type))))
+    extra_match = None
+    sequencing_centre = partial_key_match(query, dict_sequencing_centre)
+    if sequencing_centre:
+        extra_match = Q(object_id__in=SequenceDataset.objects.filter(sequence_lanes__sequencing_centre=sequencing_centre).values("pk"))
+    dataset_type = partial_key_match(query, dict_dataset_type)
+    if dataset_type:
+        dataset_type_match = Q(object_id__in=SequenceDataset.objects.filter(dataset_type=dataset_type).values("pk"))
+        extra_match = dataset_type_match if extra_match is None else extra_match | dataset_type_match
 
-    context = remove_duplicate(context)
+    return extra_match
 
-    context["total"] = len(context["sample"]["Patients"] + context["sample"]["Samples"] + context["dataset"]["Datasets"]+ context["analysis"]["Submissions"] +
-                           context["dataset"]["ResultDatasets"] +  context["analysis"]["Analyses"] +  context["analysis"]["Tags"] )
-
-    return context
 
 def partial_key_match(lookup, dict):
     for key,value in dict.items():
         if lookup in key:
             return value
     return False
-
-
-def remove_duplicate(context):
-    context["sample"]["Patients"] = list(set(context["sample"]["Patients"]))
-    context["sample"]["Samples"]  = list(set(context["sample"]["Samples"]))
-    context["dataset"]["Datasets"] = list(set(context["dataset"]["Datasets"]))
-    context["analysis"]["Submissions"] = list(set(context["analysis"]["Submissions"]))
-    context["dataset"]["ResultDatasets"] = list(set(context["dataset"]["ResultDatasets"]))
-    context["analysis"]["Analyses"] = list(set(context["analysis"]["Analyses"]))
-    context["analysis"]["Tags"] = list(set(context["analysis"]["Tags"]))
-
-    return context
-
@@ -1,8 +1,15 @@
 """Contains filters for API viewsets."""
 
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models
+from django.db.models import Exists, OuterRef
+from django.db.models.constants import LOOKUP_SEP
 from django_filters import rest_framework as filters
+from django_filters.fields import BaseCSVField
+from django_filters.utils import label_for_filter
+from django_filters.widgets import BaseCSVWidget
 from tantalus.models import (
+    TRIGRAM_LOOKUPS,
     Analysis,
     DNALibrary,
     FileInstance,
@@ -21,6 +28,30 @@ from tantalus.models import (
 )
 
 
+class ListCSVWidget(BaseCSVWidget):
+    """CSV widget which also takes a list as is, as in a JSON request body.
+
+    Splitting on commas would split values which contain commas
+    themselves, such as some filenames.
+    """
+
+    def value_from_datadict(self, data, files, name):
+        value = data.get(name)
+        if isinstance(value, list):
+            return value
+        return super(ListCSVWidget, self).value_from_datadict(data, files, name)
+
+
+class ListCSVField(BaseCSVField):
+    base_widget_class = ListCSVWidget
+
+
+class ListInFilter(filters.BaseInFilter):
+    """In filter taking comma separated values or a list."""
+
+    base_field_class = ListCSVField
+
+
 class BaseFilterSet(filters.FilterSet):
     """Base filterset class.
 
@@ -45,8 +76,83 @@ class BaseFilterSet(filters.FilterSet):
             models.OneToOneField: {"filter_class": filters.CharFilter},
         }
 
+    @classmethod
+    def filter_for_field(cls, field, field_name, lookup_expr="exact"):
+        """Route pattern lookups on text fields through the trigram lookups.
+
+        The filter keeps the name and label of the builtin lookup, so
+        e.g. filename__endswith still works, but matches on the column
+        itself so that its trigram index is used.
+        """
+        filter_ = super(BaseFilterSet, cls).filter_for_field(field, field_name, lookup_expr)
+        if isinstance(field, (models.CharField, models.TextField)) and lookup_expr in TRIGRAM_LOOKUPS:
+            filter_.label = label_for_filter(cls._meta.model, field_name, lookup_expr)
+            filter_.lookup_expr = TRIGRAM_LOOKUPS[lookup_expr]
+        if lookup_expr == "in":
+            # One array parameter rather than a placeholder per value,
+            # for lists of many thousands of values
+            filter_.label = label_for_filter(cls._meta.model, field_name, lookup_expr)
+            filter_.lookup_expr = "any"
+        return filter_
+
+    @classmethod
+    def filter_for_lookup(cls, field, lookup_type):
+        """Make in filters take lists, as given in query request bodies."""
+        filter_class, params = super(BaseFilterSet, cls).filter_for_lookup(field, lookup_type)
+        if lookup_type == "in" and filter_class is not None:
+            class ConcreteListInFilter(ListInFilter, filter_class):
+                pass
+            ConcreteListInFilter.__name__ = filter_class.__name__
+            filter_class = ConcreteListInFilter
+        return filter_class, params
+
+
+class SemiJoinFilterSet(BaseFilterSet):
+    """Filterset which compiles multi-valued lookups into EXISTS subqueries.
+
+    Filtering on a lookup which spans a many-to-many or reverse foreign
+    key, such as tags__name, joins in a row per related object and needs a
+    distinct over the whole result. Such filters are instead applied to a
+    subquery correlated on the primary key, a semi-join which matches each
+    row at most once, so viewsets using this filterset need no distinct.
+    """
 
-class AnalysisFilter(BaseFilterSet):
+    @classmethod
+    def is_multi_valued(cls, field_name):
+        """Whether a field path traverses a to-many relationship."""
+        model = cls._meta.model
+        for part in field_name.split(LOOKUP_SEP):
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return False
+            if field.many_to_many or field.one_to_many:
+                return True
+            if not field.is_relation:
+                return False
+            model = field.related_model
+        return False
+
+    def filter_queryset(self, queryset):
+        for name, value in self.form.cleaned_data.items():
+            filter_ = self.filters[name]
+            if filter_.method is not None or not self.is_multi_valued(filter_.field_name):
+                queryset = filter_.filter(queryset, value)
+                continue
+
+            correlated = queryset.model._default_manager.filter(pk=OuterRef("pk"))
+            matching = filter_.filter(correlated, value)
+            if matching is correlated:
+                # Empty value, nothing to filter
+                continue
+
+            # Django 2.2 can only filter on an Exists once annotated
+            alias = "semijoin_{}".format(name.replace(LOOKUP_SEP, "_"))
+            queryset = queryset.annotate(**{alias: Exists(matching)}).filter(**{alias: True})
+        return queryset
+
+
+class AnalysisFilter(SemiJoinFilterSet):
     """Filters for analyses."""
 
     class Meta(BaseFilterSet.Meta):
@@ -69,7 +175,7 @@ class AnalysisFilter(BaseFilterSet):
         }
 
 
-class DNALibraryFilter(BaseFilterSet):
+class DNALibraryFilter(SemiJoinFilterSet):
     """Filters for DNA libraries."""
 
     class Meta(BaseFilterSet.Meta):
@@ -77,9 +183,16 @@ class DNALibraryFilter(BaseFilterSet):
         fields = {"id": ["exact"], "library_id": ["exact", "startswith"]}
 
 
-class FileInstanceFilter(BaseFilterSet):
+class FileInstanceFilter(SemiJoinFilterSet):
     """Filters for file instances."""
 
+    filepath = filters.CharFilter(method="filter_filepath", label="File path")
+    filepath__startswith = filters.CharFilter(method="filter_filepath", label="File path starts with")
+
+    def filter_filepath(self, queryset, name, value):
+        """Filter on the file path as computed in the database."""
+        return queryset.annotate_filepath().filter(**{name: value})
+
     def __init__(self, *args, **kwargs):
         super(FileInstanceFilter, self).__init__(*args, **kwargs)
         """Take care of filter names that render poorly."""
@@ -105,7 +218,7 @@ class FileInstanceFilter(BaseFilterSet):
         }
 
 
-class FileResourceFilter(BaseFilterSet):
+class FileResourceFilter(SemiJoinFilterSet):
     """Filters for file resources."""
 
     def __init__(self, *args, **kwargs):
@@ -132,7 +245,7 @@ class FileResourceFilter(BaseFilterSet):
         }
 
 
-class ResultsDatasetFilter(filters.FilterSet):
+class ResultsDatasetFilter(SemiJoinFilterSet):
     """Filters for results datasets."""
 
     def __init__(self, *args, **kwargs):
@@ -159,7 +272,7 @@ class ResultsDatasetFilter(filters.FilterSet):
             "file_resources__fileinstance__storage__name": ["exact"],
         }
 
-class PatientFilter(filters.FilterSet):
+class PatientFilter(SemiJoinFilterSet):
 
     class Meta(BaseFilterSet.Meta):
         model = Patient
@@ -170,7 +283,7 @@ class PatientFilter(filters.FilterSet):
             "case_id": ["exact"],
         }
 
-class SampleFilter(BaseFilterSet):
+class SampleFilter(SemiJoinFilterSet):
     """Filters for samples."""
 
     def __init__(self, *args, **kwargs):
@@ -190,9 +303,18 @@ class SampleFilter(BaseFilterSet):
         }
 
 
-class SequenceDatasetFilter(filters.FilterSet):
+class SequenceDatasetFilter(SemiJoinFilterSet):
     """Filters for sequence datasets."""
 
+    latest_only = filters.BooleanFilter(method="filter_latest_only", label="Latest version only")
+
+    def filter_latest_only(self, queryset, name, value):
+        """Keep the highest version of each name among the matching datasets."""
+        if not value:
+            return queryset
+        latest = queryset.order_by("name", "-version_number").distinct("name").values("pk")
+        return queryset.filter(pk__in=latest)
+
     def __init__(self, *args, **kwargs):
         """Take care of filter names that render poorly."""
         super(SequenceDatasetFilter, self).__init__(*args, **kwargs)
@@ -220,9 +342,11 @@ class SequenceDatasetFilter(filters.FilterSet):
             "file_resources__filename": ["exact"],
             "file_resources__id": ["exact"],
             "file_resources__fileinstance__storage__name": ["exact"],
+            "num_sequence_lanes": ["exact", "gte", "lte"],
+            "is_complete": ["exact"],
         }
 
-class CurationFilter(filters.FilterSet):
+class CurationFilter(SemiJoinFilterSet):
     """Filters for curations."""
 
     class Meta(BaseFilterSet.Meta):
@@ -233,7 +357,7 @@ class CurationFilter(filters.FilterSet):
             "owner": ["exact"]
         }
 
-class CurationDatasetFilter(filters.FilterSet):
+class CurationDatasetFilter(SemiJoinFilterSet):
     """Filters for curations."""
 
     class Meta(BaseFilterSet.Meta):
@@ -245,7 +369,7 @@ class CurationDatasetFilter(filters.FilterSet):
             "version": ["exact"],
         }
 
-class SequenceFileInfoFilter(BaseFilterSet):
+class SequenceFileInfoFilter(SemiJoinFilterSet):
     """Filters for sequence file infos."""
 
     class Meta(BaseFilterSet.Meta):
@@ -257,7 +381,7 @@ class SequenceFileInfoFilter(BaseFilterSet):
         }
 
 
-class SequencingLaneFilter(BaseFilterSet):
+class SequencingLaneFilter(SemiJoinFilterSet):
     """Filters for sequencing lanes."""
 
     class Meta(BaseFilterSet.Meta):
@@ -274,7 +398,7 @@ class SequencingLaneFilter(BaseFilterSet):
         }
 
 
-class ServerStorageFilter(BaseFilterSet):
+class ServerStorageFilter(SemiJoinFilterSet):
     """Filters for server storages."""
 
     class Meta(BaseFilterSet.Meta):
@@ -282,7 +406,7 @@ class ServerStorageFilter(BaseFilterSet):
         fields = {"id": ["exact"], "name": ["exact"]}
 
 
-class StorageFilter(BaseFilterSet):
+class StorageFilter(SemiJoinFilterSet):
     """Filters for storages."""
 
     class Meta(BaseFilterSet.Meta):
@@ -290,7 +414,7 @@ class StorageFilter(BaseFilterSet):
         fields = {"id": ["exact"], "name": ["exact"]}
 
 
-class TagFilter(BaseFilterSet):
+class TagFilter(SemiJoinFilterSet):
     """Filters for tags."""
 
     class Meta(BaseFilterSet.Meta):
@@ -1,22 +1,227 @@
-from django.db import transaction
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Q
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, ValidationError
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from rest_framework.validators import UniqueTogetherValidator
+from simple_history.utils import bulk_create_with_history
 
 import tantalus.models
 
 
-class SampleSerializer(serializers.ModelSerializer):
+class EagerLoadingMixin(object):
+    """ Declares the related rows a serializer reads, nested serializers
+    included, so that views can fetch them with the list query rather than
+    once per object.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+
+def pk_prefetch(lookup, model):
+    """Prefetch a relation that is only serialized as primary keys."""
+    return Prefetch(lookup, queryset=model.objects.only('pk'))
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    """ Many related field which validates the whole list at once,
+    with one query rather than one per item.
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return self.child_relation.to_internal_value_many(data)
+
+
+class BatchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """ Primary key related field which looks up lists of keys in one
+    query, and reports all the keys that do not exist together.
+
+    Subclasses accept other kinds of keys by overriding to_key, which
+    turns input into a hashable key, and lookup, which maps keys to objects.
+    """
+    default_error_messages = {
+        'does_not_exist_many': 'Invalid keys {values} - objects do not exist.',
+    }
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def to_key(self, data, model):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            return model._meta.pk.to_python(data)
+        except ValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def lookup(self, queryset, keys):
+        return {obj.pk: obj for obj in queryset.filter(pk__any=list(keys))}
+
+    def to_internal_value_many(self, data):
+        queryset = self.get_queryset()
+        keys = [self.to_key(item, queryset.model) for item in data]
+        objects = self.lookup(queryset, set(keys))
+        missing = [item for item, key in zip(data, keys) if key not in objects]
+        if len(data) == 1 and missing:
+            self.fail('does_not_exist', pk_value=missing[0])
+        if missing:
+            self.fail('does_not_exist_many', values=', '.join(str(item) for item in missing))
+        return [objects[key] for key in keys]
+
+    def to_internal_value(self, data):
+        return self.to_internal_value_many([data])[0]
+
+
+class NaturalKeyRelatedField(BatchedPrimaryKeyRelatedField):
+    """ Related field taking either primary keys or natural keys.
+
+    Integers are primary keys as before, and strings are values of the
+    natural_key field of the related model. Strings of digits may be
+    either, and are refused if they are the natural key of one object and
+    the primary key of another.
+    """
+    default_error_messages = {
+        'ambiguous_key': 'Key {value} is both a primary key and a natural key of different objects.',
+    }
+
+    def __init__(self, natural_key=None, **kwargs):
+        self.natural_key = natural_key
+        super(NaturalKeyRelatedField, self).__init__(**kwargs)
+
+    def to_key(self, data, model):
+        if isinstance(data, str):
+            return data
+        return super(NaturalKeyRelatedField, self).to_key(data, model)
+
+    def lookup(self, queryset, keys):
+        natural_keys = [key for key in keys if isinstance(key, str)]
+        pks = [key for key in keys if not isinstance(key, str)]
+        pks += [int(key) for key in natural_keys if key.isdecimal()]
+
+        by_pk = {}
+        by_natural_key = {}
+        for obj in queryset.filter(Q(pk__any=pks) | Q(**{self.natural_key + '__any': natural_keys})):
+            by_pk[obj.pk] = obj
+            by_natural_key[getattr(obj, self.natural_key)] = obj
+
+        objects = {}
+        for key in keys:
+            if not isinstance(key, str):
+                obj = by_pk.get(key)
+            elif not key.isdecimal():
+                obj = by_natural_key.get(key)
+            else:
+                obj = by_natural_key.get(key)
+                pk_obj = by_pk.get(int(key))
+                if obj is not None and pk_obj is not None and obj.pk != pk_obj.pk:
+                    self.fail('ambiguous_key', value=key)
+                obj = obj or pk_obj
+            if obj is not None:
+                objects[key] = obj
+        return objects
+
+
+class SequencingLaneRelatedField(BatchedPrimaryKeyRelatedField):
+    """ Sequencing lane field taking either primary keys or natural keys.
+
+    Natural keys are objects with flowcell_id and lane_number, which may be
+    left out for lanes without one, and a library_id where a flowcell lane
+    was sequenced for several libraries.
+    """
+    default_error_messages = {
+        'invalid_lane': 'Expected pk value or object with flowcell_id and optionally lane_number.',
+        'ambiguous': 'Lanes {lanes} are of several libraries, a library_id is required.',
+    }
+
+    def to_key(self, data, model):
+        if not isinstance(data, dict):
+            return super(SequencingLaneRelatedField, self).to_key(data, model)
+        if 'flowcell_id' not in data:
+            self.fail('invalid_lane')
+        # Lane numbers are optional, and blank on lanes created without one
+        return (data['flowcell_id'], str(data.get('lane_number', '')), data.get('library_id'))
+
+    def lookup(self, queryset, keys):
+        pks = [key for key in keys if not isinstance(key, tuple)]
+        flowcell_ids = list({key[0] for key in keys if isinstance(key, tuple)})
+        lanes = (
+            queryset
+            .filter(Q(pk__any=pks) | Q(flowcell_id__any=flowcell_ids))
+            .select_related('dna_library'))
+
+        objects = {}
+        ambiguous = set()
+        for lane in lanes:
+            objects[lane.pk] = lane
+            objects[(lane.flowcell_id, lane.lane_number, lane.dna_library.library_id)] = lane
+            any_library = (lane.flowcell_id, lane.lane_number, None)
+            if any_library in objects:
+                ambiguous.add(any_library)
+            objects[any_library] = lane
+
+        ambiguous &= keys
+        if ambiguous:
+            self.fail('ambiguous', lanes=', '.join(
+                '{}_{}'.format(flowcell_id, lane_number)
+                for flowcell_id, lane_number, _ in sorted(ambiguous)))
+        return objects
+
+
+class BaseModelSerializer(serializers.ModelSerializer):
+    """ Base model serializer, validating related primary keys in one
+    query per field rather than one per key.
+    """
+    serializer_related_field = BatchedPrimaryKeyRelatedField
+
+
+class NaturalKeyModelSerializer(BaseModelSerializer):
+    """ Model serializer whose related fields named in natural_key_fields
+    also accept natural keys, mapping each to the natural key field of
+    the related model.
+    """
+    natural_key_fields = {}
+
+    def build_relational_field(self, field_name, relation_info):
+        field_class, field_kwargs = super(NaturalKeyModelSerializer, self).build_relational_field(
+            field_name, relation_info)
+        if field_name in self.natural_key_fields:
+            field_class = NaturalKeyRelatedField
+            field_kwargs['natural_key'] = self.natural_key_fields[field_name]
+        return field_class, field_kwargs
+
+
+class SampleSerializer(BaseModelSerializer):
     class Meta:
         model = tantalus.models.Sample
         fields = '__all__'
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(BaseModelSerializer):
     class Meta:
         model = tantalus.models.Patient
         fields = '__all__'
 
-class StorageSerializer(serializers.ModelSerializer):
+class StorageSerializer(BaseModelSerializer):
     class Meta:
         model = tantalus.models.Storage
         exclude = ['polymorphic_ctype']
@@ -31,7 +236,7 @@ class StorageSerializer(serializers.ModelSerializer):
         return super(StorageSerializer, self).to_representation(obj)
 
 
-class ServerStorageSerializer(serializers.ModelSerializer):
+class ServerStorageSerializer(BaseModelSerializer):
     prefix = serializers.SerializerMethodField()
     storage_type = serializers.CharField(read_only=True)
 
@@ -50,7 +255,7 @@ class ServerStorageSerializer(serializers.ModelSerializer):
         )
 
 
-class AzureBlobStorageSerializer(serializers.ModelSerializer):
+class AzureBlobStorageSerializer(BaseModelSerializer):
     prefix = serializers.SerializerMethodField()
     storage_type = serializers.CharField(read_only=True)
 
@@ -69,7 +274,7 @@ class AzureBlobStorageSerializer(serializers.ModelSerializer):
         )
 
 
-class AwsS3StorageSerializer(serializers.ModelSerializer):
+class AwsS3StorageSerializer(BaseModelSerializer):
     prefix = serializers.SerializerMethodField()
     storage_type = serializers.CharField(read_only=True)
 
@@ -87,36 +292,58 @@ class AwsS3StorageSerializer(serializers.ModelSerializer):
         )
 
 
-class FileInstanceSerializer(serializers.ModelSerializer):
+class FileInstanceSerializer(BaseModelSerializer):
     class Meta:
         model = tantalus.models.FileInstance
         fields = '__all__'
 
 
-class SequenceFileInfoSerializer(serializers.ModelSerializer):
+class SequenceFileInfoSerializer(BaseModelSerializer):
     class Meta:
         model = tantalus.models.SequenceFileInfo
         fields = '__all__'
 
 
-class FileResourceSerializer(serializers.ModelSerializer):
+class FileResourceSerializer(BaseModelSerializer):
     sequencefileinfo = SequenceFileInfoSerializer(read_only=True)
     class Meta:
         model = tantalus.models.FileResource
         fields = '__all__'
 
 
-class FileResourceSerializerRead(serializers.ModelSerializer):
+class FileResourceSerializerRead(EagerLoadingMixin, BaseModelSerializer):
     sequencefileinfo = SequenceFileInfoSerializer(read_only=True)
+    select_related_fields = ('sequencefileinfo',)
+
     class Meta:
         model = tantalus.models.FileResource
         fields = '__all__'
 
-class FileInstanceSerializerRead(serializers.ModelSerializer):
+class CachedStorageField(serializers.Field):
+    """ Serializes a storage foreign key from the process wide storage
+    cache, without querying the storage tables.
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs.setdefault('source', 'storage_id')
+        super(CachedStorageField, self).__init__(**kwargs)
+        self.representations = {}
+
+    def to_representation(self, storage_id):
+        if storage_id not in self.representations:
+            storage = tantalus.models.get_storage(storage_id)
+            self.representations[storage_id] = StorageSerializer(
+                storage, context=self.context).to_representation(storage)
+        return self.representations[storage_id]
+
+
+class FileInstanceSerializerRead(EagerLoadingMixin, BaseModelSerializer):
     filepath = serializers.SerializerMethodField()
-    storage = StorageSerializer(read_only=True)
+    storage = CachedStorageField()
     file_resource = FileResourceSerializer(read_only=True)
 
+    select_related_fields = ('file_resource__sequencefileinfo',)
+
     def get_filepath(self, obj):
         return obj.get_filepath()
 
@@ -124,8 +351,10 @@ class FileInstanceSerializerRead(serializers.ModelSerializer):
         model = tantalus.models.FileInstance
         fields = '__all__'
 
-class FileResourceInstancesSerilizer(serializers.ModelSerializer):
+class FileResourceInstancesSerilizer(EagerLoadingMixin, BaseModelSerializer):
     fileinstance_set = FileInstanceSerializerRead(read_only=True, many=True)
+    prefetch_related_fields = ('fileinstance_set__file_resource__sequencefileinfo',)
+
     class Meta:
         model = tantalus.models.SequenceFileInfo
         fields = (
@@ -133,6 +362,182 @@ class FileResourceInstancesSerilizer(serializers.ModelSerializer):
             'fileinstance_set'
         )
 
+BULK_CREATE_ATTEMPTS = 3
+
+
+def bulk_create_file_resources(items):
+    """Create file resources with their file instances and sequence file infos.
+
+    Everything is written with one set based insert per table. File
+    resources and file instances that already exist are reused rather than
+    duplicated. Returns a list of per item results in input order.
+
+    A concurrent request may insert the same rows between the existence
+    checks and the inserts. The insert then fails once that request has
+    committed, so the attempt is rolled back and retried, and the retry
+    reuses those rows.
+    """
+    for attempt in range(BULK_CREATE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return _bulk_create_file_resources(items)
+        except IntegrityError:
+            if attempt == BULK_CREATE_ATTEMPTS - 1:
+                raise serializers.ValidationError(
+                    'file resources were being created by concurrent requests, retry the request')
+
+
+def _bulk_create_file_resources(items):
+    owner = items[0].get('owner') if items else None
+
+    filenames = [item['filename'] for item in items]
+    file_resources = tantalus.models.FileResource.objects.in_bulk(filenames, field_name='filename')
+    existing_filenames = set(file_resources)
+
+    new_file_resources = []
+    for item in items:
+        if item['filename'] in existing_filenames:
+            continue
+        fields = {
+            key: value for key, value in item.items()
+            if key not in ('file_instances', 'sequencefileinfo')}
+        file_resource = tantalus.models.FileResource(**fields)
+        file_resource._history_user = owner
+        new_file_resources.append(file_resource)
+
+    for file_resource in bulk_create_with_history(new_file_resources, tantalus.models.FileResource):
+        file_resources[file_resource.filename] = file_resource
+
+    file_resource_ids = [file_resource.id for file_resource in file_resources.values()]
+
+    file_instance_ids = {
+        (file_resource_id, storage_id): file_instance_id
+        for file_instance_id, file_resource_id, storage_id
+        in tantalus.models.FileInstance.objects.filter(
+            file_resource_id__in=file_resource_ids).values_list('id', 'file_resource_id', 'storage_id')}
+    existing_file_instances = set(file_instance_ids)
+
+    new_file_instances = []
+    for item in items:
+        file_resource = file_resources[item['filename']]
+        for file_instance_data in item.get('file_instances', ()):
+            key = (file_resource.id, file_instance_data['storage'].id)
+            if key in file_instance_ids:
+                continue
+            file_instance = tantalus.models.FileInstance(
+                file_resource=file_resource,
+                storage_id=file_instance_data['storage'].id,
+                is_deleted=file_instance_data.get('is_deleted', False),
+                owner=owner,
+            )
+            file_instance._history_user = owner
+            file_instance_ids[key] = None
+            new_file_instances.append(file_instance)
+
+    for file_instance in bulk_create_with_history(new_file_instances, tantalus.models.FileInstance):
+        file_instance_ids[(file_instance.file_resource_id, file_instance.storage_id)] = file_instance.id
+
+    sequence_file_info_ids = dict(
+        tantalus.models.SequenceFileInfo.objects.filter(
+            file_resource_id__in=file_resource_ids).values_list('file_resource_id', 'id'))
+    existing_sequence_file_infos = set(sequence_file_info_ids)
+
+    new_sequence_file_infos = []
+    for item in items:
+        file_resource = file_resources[item['filename']]
+        if item.get('sequencefileinfo') is None or file_resource.id in sequence_file_info_ids:
+            continue
+        sequence_file_info = tantalus.models.SequenceFileInfo(
+            file_resource=file_resource,
+            owner=owner,
+            **item['sequencefileinfo'])
+        sequence_file_info._history_user = owner
+        sequence_file_info_ids[file_resource.id] = None
+        new_sequence_file_infos.append(sequence_file_info)
+
+    for sequence_file_info in bulk_create_with_history(new_sequence_file_infos, tantalus.models.SequenceFileInfo):
+        sequence_file_info_ids[sequence_file_info.file_resource_id] = sequence_file_info.id
+
+    results = []
+    for item in items:
+        file_resource = file_resources[item['filename']]
+        results.append({
+            'id': file_resource.id,
+            'filename': file_resource.filename,
+            'created': file_resource.filename not in existing_filenames,
+            'file_instances': [
+                {
+                    'id': file_instance_ids[(file_resource.id, data['storage'].id)],
+                    'storage': data['storage'].name,
+                    'created': (file_resource.id, data['storage'].id) not in existing_file_instances,
+                }
+                for data in item.get('file_instances', ())],
+            'sequencefileinfo': sequence_file_info_ids.get(file_resource.id),
+            'sequencefileinfo_created': (
+                item.get('sequencefileinfo') is not None and
+                file_resource.id not in existing_sequence_file_infos),
+        })
+
+    return results
+
+
+class FileInstanceBulkSerializer(serializers.Serializer):
+    storage = serializers.CharField(help_text='Name of the storage')
+    is_deleted = serializers.BooleanField(required=False, default=False)
+
+
+class SequenceFileInfoBulkSerializer(BaseModelSerializer):
+    class Meta:
+        model = tantalus.models.SequenceFileInfo
+        fields = ('read_end', 'genome_region', 'index_sequence')
+
+
+class FileResourceBulkListSerializer(serializers.ListSerializer):
+    """ Validates and creates a list of file resources at once.
+    Storages for all nested file instances are resolved with a single query.
+    """
+    def validate(self, attrs):
+        filename_counts = Counter(item['filename'] for item in attrs)
+        duplicates = sorted(filename for filename, count in filename_counts.items() if count > 1)
+        if duplicates:
+            raise serializers.ValidationError('duplicate filenames {}'.format(', '.join(duplicates)))
+
+        storage_names = set(
+            file_instance['storage']
+            for item in attrs
+            for file_instance in item.get('file_instances', ()))
+        storages = {
+            storage.name: storage for storage in
+            tantalus.models.Storage.objects.non_polymorphic().filter(name__in=storage_names)}
+        missing = sorted(storage_names - set(storages))
+        if missing:
+            raise serializers.ValidationError('storages {} do not exist'.format(', '.join(missing)))
+
+        for item in attrs:
+            for file_instance in item.get('file_instances', ()):
+                file_instance['storage'] = storages[file_instance['storage']]
+
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        return bulk_create_file_resources(validated_data)
+
+
+class FileResourceBulkSerializer(BaseModelSerializer):
+    file_instances = FileInstanceBulkSerializer(many=True, required=False)
+    sequencefileinfo = SequenceFileInfoBulkSerializer(required=False, allow_null=True)
+
+    class Meta:
+        model = tantalus.models.FileResource
+        list_serializer_class = FileResourceBulkListSerializer
+        fields = ('filename', 'size', 'created', 'md5', 'is_folder', 'file_instances', 'sequencefileinfo')
+        extra_kwargs = {
+            # Existing file resources are reused, skip the per item uniqueness query
+            'filename': {'validators': []},
+        }
+
+
 class LibraryTypeField(serializers.Field):
     def to_representation(self, obj):
         return obj.name
@@ -143,14 +548,16 @@ class LibraryTypeField(serializers.Field):
             raise ValidationError('{} does not exist'.format(data))
 
 
-class DNALibrarySerializer(serializers.ModelSerializer):
+class DNALibrarySerializer(EagerLoadingMixin, BaseModelSerializer):
     library_type = LibraryTypeField()
+    select_related_fields = ('library_type',)
+
     class Meta:
         model = tantalus.models.DNALibrary
         fields = '__all__'
 
 
-class SequencingLaneSerializer(serializers.ModelSerializer):
+class SequencingLaneSerializer(BaseModelSerializer):
     class Meta:
         model = tantalus.models.SequencingLane
         fields = '__all__'
@@ -176,50 +583,220 @@ class ReferenceGenomeField(serializers.Field):
             raise ValidationError('{} does not exist'.format(data))
 
 
-class SequenceDatasetSerializer(serializers.ModelSerializer):
+class SequenceDatasetSerializer(NaturalKeyModelSerializer):
+    """ Takes sample, library and file_resources by primary key or by
+    sample_id, library_id and filename, and sequence_lanes by primary key
+    or as {"flowcell_id": ..., "lane_number": ..., "library_id": ...}.
+    """
     aligner = AlignmentToolField(required=False, allow_null=True)
     reference_genome = ReferenceGenomeField(required=False, allow_null=True)
+    sequence_lanes = SequencingLaneRelatedField(
+        many=True,
+        allow_empty=False,
+        queryset=tantalus.models.SequencingLane.objects.all(),)
+
+    allocate_version = serializers.BooleanField(
+        default=False,
+        write_only=True,
+        help_text='Create the dataset with the next version number of its name.')
+
+    natural_key_fields = {
+        'sample': 'sample_id',
+        'library': 'library_id',
+        'file_resources': 'filename',
+    }
+
     class Meta:
         model = tantalus.models.SequenceDataset
         fields = '__all__'
 
+    def allocates_version(self):
+        initial_data = getattr(self, 'initial_data', None)
+        return (
+            isinstance(initial_data, dict) and
+            initial_data.get('allocate_version') in serializers.BooleanField.TRUE_VALUES)
+
+    def get_validators(self):
+        validators = super(SequenceDatasetSerializer, self).get_validators()
+        if self.allocates_version():
+            # The version number is allocated on create, unique by construction
+            validators = [
+                validator for validator in validators
+                if not isinstance(validator, UniqueTogetherValidator)]
+        return validators
+
+    def allocate_version_number(self, validated_data):
+        """Set the next version number of the name if asked to, in a transaction."""
+        if validated_data.pop('allocate_version', False):
+            validated_data['version_number'] = tantalus.models.SequenceDataset.next_version_number(
+                validated_data['name'])
+
+    @transaction.atomic
+    def create(self, validated_data):
+        self.allocate_version_number(validated_data)
+        return super(SequenceDatasetSerializer, self).create(validated_data)
+
+    def update(self, instance, validated_data):
+        validated_data.pop('allocate_version', None)
+        return super(SequenceDatasetSerializer, self).update(instance, validated_data)
+
+
+def get_lane_key(lane_data):
+    """Flowcell id and lane number of lane data, with the model default for a missing lane number."""
+    return (lane_data['flowcell_id'], lane_data.get('lane_number', ''))
+
+
+def bulk_get_or_create_sequencing_lanes(library, lanes_data, owner):
+    """Get or create the sequencing lanes of a library by flowcell id and lane number.
+
+    Returns the lanes in input order, and whether any were created.
+    """
+    lanes = {
+        (lane.flowcell_id, lane.lane_number): lane
+        for lane in tantalus.models.SequencingLane.objects.filter(dna_library=library)}
 
-class SequenceDatasetSerializerRead(serializers.ModelSerializer):
+    new_lanes = []
+    for lane_data in lanes_data:
+        key = get_lane_key(lane_data)
+        if key in lanes:
+            continue
+        lane = tantalus.models.SequencingLane(dna_library=library, owner=owner, **lane_data)
+        lane._history_user = owner
+        lanes[key] = lane
+        new_lanes.append(lane)
+
+    bulk_create_with_history(new_lanes, tantalus.models.SequencingLane)
+
+    return [lanes[get_lane_key(lane_data)] for lane_data in lanes_data], bool(new_lanes)
+
+
+def bulk_get_or_create_tags(names, owner):
+    """Get or create tags by name."""
+    tags = tantalus.models.Tag.objects.in_bulk(names, field_name='name')
+
+    new_tags = []
+    for name in set(names) - set(tags):
+        tag = tantalus.models.Tag(name=name, owner=owner)
+        tag._history_user = owner
+        new_tags.append(tag)
+
+    return list(tags.values()) + bulk_create_with_history(new_tags, tantalus.models.Tag)
+
+
+class SequencingLaneBundleSerializer(BaseModelSerializer):
+    class Meta:
+        model = tantalus.models.SequencingLane
+        exclude = ('dna_library', 'owner')
+
+
+class SequenceDatasetBundleSerializer(SequenceDatasetSerializer):
+    """ Takes a sequence dataset with everything it refers to: the sequence
+    lanes of its library, its file resources with their file instances and
+    sequence file infos, and the names of its tags. Lanes, file resources,
+    file instances, file infos and tags which already exist are reused.
+    """
+    sequence_lanes = SequencingLaneBundleSerializer(many=True, allow_empty=False)
+    file_resources = FileResourceBulkSerializer(many=True)
+    tags = serializers.ListField(child=serializers.CharField(max_length=50), required=False)
+
+    class Meta(SequenceDatasetSerializer.Meta):
+        # Datasets are looked up by name and version number for idempotence
+        # rather than rejected as duplicates
+        validators = []
+
+    def validate_allocate_version(self, value):
+        if value:
+            raise serializers.ValidationError(
+                'bundles are looked up by name and version number so that retries are '
+                'idempotent, give the version number instead')
+        return value
+
+    @transaction.atomic
+    def create(self, validated_data):
+        validated_data.pop('allocate_version', None)
+        owner = validated_data.get('owner')
+        library = validated_data['library']
+        lanes_data = validated_data.pop('sequence_lanes')
+        file_resources_data = validated_data.pop('file_resources')
+        tag_names = validated_data.pop('tags', [])
+
+        lanes, lanes_created = bulk_get_or_create_sequencing_lanes(library, lanes_data, owner)
+        file_resources = bulk_create_file_resources(
+            [dict(item, owner=owner) for item in file_resources_data])
+        tags = bulk_get_or_create_tags(tag_names, owner)
+
+        dataset = tantalus.models.SequenceDataset.objects.create(**validated_data)
+        dataset.file_resources.add(*[file_resource['id'] for file_resource in file_resources])
+        dataset.sequence_lanes.add(*lanes)
+        dataset.tags.add(*tags)
+
+        if lanes_created:
+            # Lanes were bulk created without signals, and other datasets
+            # of the library now have more lanes in total
+            tantalus.models.update_sequence_lane_counts(
+                tantalus.models.SequenceDataset.objects.filter(library=library))
+            dataset.refresh_from_db(fields=tantalus.models.LANE_COUNT_FIELDS)
+
+        return dataset
+
+
+class SequenceDatasetSerializerRead(EagerLoadingMixin, BaseModelSerializer):
     sample = SampleSerializer()
     library = DNALibrarySerializer()
     sequence_lanes = SequencingLaneSerializer(many=True)
     aligner = AlignmentToolField()
     reference_genome = ReferenceGenomeField()
-    is_complete = serializers.SerializerMethodField()
 
-    def get_is_complete(self, obj):
-        return obj.get_is_complete()
+    select_related_fields = (
+        'sample',
+        'library__library_type',
+        'aligner',
+        'reference_genome',
+    )
+    prefetch_related_fields = (
+        'sequence_lanes',
+        pk_prefetch('sample__projects', tantalus.models.Project),
+        pk_prefetch('tags', tantalus.models.Tag),
+        pk_prefetch('file_resources', tantalus.models.FileResource),
+    )
 
     class Meta:
         model = tantalus.models.SequenceDataset
         fields = '__all__'
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(BaseModelSerializer):
     """ Serializer for tags.
-    Note that this serializer will always update by
-    adding the tag to the given datasets.
+    Note that this serializer will by default update by
+    adding the tag to the given datasets.  Set mode to
+    remove to untag the given datasets, or to replace to
+    make them the only datasets carrying the tag.
     """
-    sequencedataset_set = serializers.PrimaryKeyRelatedField(
+    sequencedataset_set = BatchedPrimaryKeyRelatedField(
         many=True,
         allow_null=True,
         required=False,
         queryset=tantalus.models.SequenceDataset.objects.all(),)
 
-    resultsdataset_set = serializers.PrimaryKeyRelatedField(
+    resultsdataset_set = BatchedPrimaryKeyRelatedField(
         many=True,
         allow_null=True,
         required=False,
         queryset=tantalus.models.ResultsDataset.objects.all(),)
 
+    mode = serializers.ChoiceField(
+        choices=('add', 'remove', 'replace'),
+        default='add',
+        write_only=True,)
+
+    dataset_fields = (
+        ('sequencedataset_set', tantalus.models.SequenceDataset),
+        ('resultsdataset_set', tantalus.models.ResultsDataset),
+    )
+
     class Meta:
         model = tantalus.models.Tag
-        fields = ('id', 'name', 'owner', 'sequencedataset_set', 'resultsdataset_set')
+        fields = ('id', 'name', 'owner', 'sequencedataset_set', 'resultsdataset_set', 'mode')
 
     def is_valid(self, raise_exception=False):
         if hasattr(self, 'initial_data'):
@@ -233,27 +810,65 @@ class TagSerializer(serializers.ModelSerializer):
         else:
             return super(TagSerializer, self).is_valid(raise_exception)
 
+    def update_datasets(self, instance, validated_data, mode):
+        for field_name, dataset_model in self.dataset_fields:
+            if field_name not in validated_data:
+                continue
+            dataset_ids = [dataset.pk for dataset in validated_data[field_name] if dataset is not None]
+            if mode == 'remove':
+                instance.remove_datasets(dataset_model, dataset_ids)
+            elif mode == 'replace':
+                instance.set_datasets(dataset_model, dataset_ids)
+            else:
+                instance.add_datasets(dataset_model, dataset_ids)
+
+    @transaction.atomic
+    def create(self, validated_data):
+        mode = validated_data.pop('mode', 'add')
+        datasets = {
+            field_name: validated_data.pop(field_name)
+            for field_name, _ in self.dataset_fields
+            if field_name in validated_data}
+        instance = super(TagSerializer, self).create(validated_data)
+        self.update_datasets(instance, datasets, mode)
+        return instance
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         if 'owner' in validated_data:
             instance.owner = validated_data['owner']
             instance.save()
-        for sequencedataset in validated_data.get('sequencedataset_set', ()):
-            sequencedataset.tags.add(instance)
-        for resultsdataset in validated_data.get('resultsdataset_set', ()):
-            resultsdataset.tags.add(instance)
+        self.update_datasets(instance, validated_data, validated_data.get('mode', 'add'))
         return instance
 
 
-class ResultsDatasetSerializer(serializers.ModelSerializer):
+class ResultsDatasetSerializer(NaturalKeyModelSerializer):
+    """ Takes samples, libraries and file_resources by primary key or by
+    sample_id, library_id and filename.
+    """
+    natural_key_fields = {
+        'samples': 'sample_id',
+        'libraries': 'library_id',
+        'file_resources': 'filename',
+    }
+
     class Meta:
         model = tantalus.models.ResultsDataset
         fields = '__all__'
 
 
-class ResultsDatasetSerializerRead(serializers.ModelSerializer):
+class ResultsDatasetSerializerRead(EagerLoadingMixin, BaseModelSerializer):
     samples = SampleSerializer(many=True)
     libraries = DNALibrarySerializer(many=True)
 
+    prefetch_related_fields = (
+        'samples',
+        pk_prefetch('samples__projects', tantalus.models.Project),
+        'libraries__library_type',
+        pk_prefetch('tags', tantalus.models.Tag),
+        pk_prefetch('file_resources', tantalus.models.FileResource),
+    )
+
     class Meta:
         model = tantalus.models.ResultsDataset
         fields = '__all__'
@@ -269,20 +884,20 @@ class AnalysisTypeField(serializers.Field):
             raise ValidationError('{} does not exist'.format(data))
 
 
-class AnalysisSerializer(serializers.ModelSerializer):
+class AnalysisSerializer(BaseModelSerializer):
     analysis_type = AnalysisTypeField()
     class Meta:
         model = tantalus.models.Analysis
         fields = '__all__'
 
 
-class CurationSerializer(serializers.ModelSerializer):
+class CurationSerializer(BaseModelSerializer):
     #sequencedatasets = SequenceDatasetSerializer()
     class Meta:
         model = tantalus.models.Curation
         fields = '__all__'
 
-class CurationDatasetSerializer(serializers.ModelSerializer):
+class CurationDatasetSerializer(BaseModelSerializer):
     #sequencedatasets = SequenceDatasetSerializer()
     class Meta:
         model = tantalus.models.CurationDataset
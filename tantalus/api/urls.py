@@ -50,5 +50,8 @@ urlpatterns = [
     url(r'^api-token-auth/', obtain_jwt_token),
     url(r'^api-token-refresh/', refresh_jwt_token),
     url(r'^api-token-verify/', verify_jwt_token),
+    url(r'^manifest/$', views.FileManifestView.as_view(), name='manifest'),
+    url(r'^storage_diff/$', views.StorageDiffView.as_view(), name='storage-diff'),
+    url(r'^resolve/$', views.NaturalKeyResolverView.as_view(), name='resolve'),
     url(r'^', include(router.urls)),
 ]
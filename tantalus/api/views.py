@@ -1,13 +1,22 @@
 from collections import OrderedDict
-from django.db import models
+import json
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator as DjangoPaginator
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
 from django_filters import rest_framework as filters
+from django_filters.filters import BaseCSVFilter
 import rest_framework.exceptions
-from rest_framework import viewsets, mixins, pagination
+from rest_framework import viewsets, mixins, pagination, status
 from rest_framework import permissions
+from rest_framework.decorators import detail_route, list_route
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
+from simple_history.utils import bulk_create_with_history
 from tantalus.api.permissions import IsOwnerOrReadOnly
 import tantalus.api.serializers
 from tantalus.api.filters import (
@@ -30,16 +39,32 @@ from tantalus.api.filters import (
 import tantalus.models
 
 
+class IdCursorPagination(pagination.CursorPagination):
+    """Keyset pagination on id, which never counts or offsets."""
+    page_size_query_param = 'page_size'
+    page_size = 10
+    ordering = 'id'
+
+
 class VariableResultsSetPagination(pagination.PageNumberPagination):
     page_size_query_param = 'page_size'
     page_size = 10
 
     def paginate_queryset(self, queryset, request, view=None):
         if 'no_pagination' in request.query_params:
+            # JSON requests are streamed by StreamingListMixin before getting
+            # here, this is left for the browsable API
             return list(queryset)
+        # Passing a cursor parameter, empty for the first page, opts in to
+        # keyset pagination: each page costs the same however deep it is
+        if IdCursorPagination.cursor_query_param in request.query_params:
+            self.cursor_paginator = IdCursorPagination()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
         return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
+        if hasattr(self, 'cursor_paginator'):
+            return self.cursor_paginator.get_paginated_response(data)
         try:
             return super().get_paginated_response(data)
         except AttributeError:
@@ -50,37 +75,329 @@ class VariableResultsSetPagination(pagination.PageNumberPagination):
             ]))
 
 
+class ApproximateCountPage(Page):
+    """Page which knows whether it has a successor without the count."""
+    def __init__(self, object_list, number, paginator, has_next):
+        super(ApproximateCountPage, self).__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class ApproximateCountPaginator(DjangoPaginator):
+    """Paginator which estimates the count of large querysets.
+
+    The estimate is the planner's: reltuples from pg_class for an
+    unfiltered queryset, otherwise the row estimate of EXPLAIN. Querysets
+    estimated at fewer than exact_count_threshold rows are counted exactly.
+    Each page is read one row past its end, so paging does not depend on
+    the count being exact.
+    """
+    exact_count_threshold = 10000
+
+    def __init__(self, *args, **kwargs):
+        super(ApproximateCountPaginator, self).__init__(*args, **kwargs)
+        self.count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate_count()
+        if estimate < self.exact_count_threshold:
+            return self.object_list.count()
+        self.count_is_estimate = True
+        return estimate
+
+    def estimate_count(self):
+        queryset = self.object_list
+        with connections[queryset.db].cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+                return max(int(row[0]), 0) if row else 0
+
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return plan[0]['Plan']['Plan Rows']
+
+    def validate_number(self, number):
+        # Only the lower bound can be checked against an estimated count
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage('That page contains no results')
+        return ApproximateCountPage(
+            object_list[:self.per_page], number, self,
+            has_next=len(object_list) > self.per_page)
+
+
+class ApproximateCountPagination(VariableResultsSetPagination):
+    """Page number pagination with estimated counts for large tables.
+
+    Pass exact_count=1 to count exactly whatever the size. Responses say
+    whether the count is an estimate in count_is_estimate.
+    """
+    django_paginator_class = ApproximateCountPaginator
+    exact_count_query_param = 'exact_count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.exact_count_query_param) in ('1', 'true'):
+            self.django_paginator_class = DjangoPaginator
+        return super(ApproximateCountPagination, self).paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super(ApproximateCountPagination, self).get_paginated_response(data)
+        if hasattr(self, 'page') and not hasattr(self, 'cursor_paginator'):
+            response.data['count_is_estimate'] = getattr(self.page.paginator, 'count_is_estimate', False)
+        return response
+
+
 class RestrictedQueryMixin(object):
     """Cause view to fail on invalid filter query parameter.
 
     Thanks to rrauenza on Stack Overflow for their post here:
     https://stackoverflow.com/questions/27182527/how-can-i-stop-django-rest-framework-to-show-all-records-if-query-parameter-is-w/50957733#50957733
     """
-    def get_queryset(self):
-        non_filter_params = set(['limit', 'offset', 'page', 'page_size', 'format', 'no_pagination'])
-
-        qs = super(RestrictedQueryMixin, self).get_queryset().order_by('id')
+    non_filter_params = set(['limit', 'offset', 'page', 'page_size', 'format', 'no_pagination', 'cursor', 'stream', 'exact_count'])
 
+    def get_filter_names(self):
         if hasattr(self, 'filter_fields') and hasattr(self, 'filter_class'):
             raise RuntimeError("%s has both filter_fields and filter_class" % self)
 
         if hasattr(self, 'filter_class'):
             filter_class = getattr(self, 'filter_class', None)
-            filters = set(filter_class.get_filters().keys())
+            return set(filter_class.get_filters().keys())
         elif hasattr(self, 'filter_fields'):
-            filters = set(getattr(self, 'filter_fields', []))
+            return set(getattr(self, 'filter_fields', []))
         else:
-            filters = set()
+            return set()
+
+    def get_queryset(self):
+        qs = super(RestrictedQueryMixin, self).get_queryset().order_by('id')
+
+        filters = self.get_filter_names()
 
         for key in self.request.GET.keys():
-            if key in non_filter_params:
+            if key in self.non_filter_params:
                 continue
             if key not in filters:
                 raise rest_framework.exceptions.APIException(
                     'no filter %s' % key)
 
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            qs = serializer_class.setup_eager_loading(qs)
+
         return qs
 
+    def get_query_data(self):
+        """Validate the filter names in a query request body, and that
+        only list filters such as in filters are given lists."""
+        if not isinstance(self.request.data, dict):
+            raise rest_framework.exceptions.ValidationError('expected an object of filters')
+
+        filters = self.get_filter_names()
+        filter_class = getattr(self, 'filter_class', None)
+
+        data = {}
+        errors = {}
+        for key, value in self.request.data.items():
+            if key not in filters:
+                raise rest_framework.exceptions.APIException(
+                    'no filter %s' % key)
+            takes_list = isinstance(filter_class.base_filters[key], BaseCSVFilter)
+            if isinstance(value, dict) or (isinstance(value, list) and not takes_list):
+                errors[key] = ['expected a list or a single value' if takes_list else 'expected a single value']
+            data[key] = value
+        if errors:
+            raise rest_framework.exceptions.ValidationError(errors)
+        return data
+
+    def filter_queryset(self, queryset):
+        if self.action != 'query':
+            return super(RestrictedQueryMixin, self).filter_queryset(queryset)
+
+        data = self.get_query_data()
+        filter_class = getattr(self, 'filter_class', None)
+        if filter_class is None:
+            return queryset
+
+        filterset = filter_class(data=data, queryset=queryset, request=self.request)
+        if not filterset.is_valid():
+            raise rest_framework.exceptions.ValidationError(filterset.errors)
+        return filterset.qs
+
+    @list_route(methods=['post'])
+    def query(self, request, *args, **kwargs):
+        """
+        List with filters given in the request body rather than the query string.
+        POST the filters as JSON, with lists for in filters however long, for example:
+            {"file_resource__in": [1, 2, 3], "storage__name": "singlecellblob"}
+        Pagination parameters still go in the query string.
+        """
+        return self.list(request, *args, **kwargs)
+
+
+class StreamingListMixin(object):
+    """Stream unpaginated list responses instead of building them in memory.
+
+    With no_pagination, rows are read through a server side cursor and
+    serialized a chunk at a time. The default output has the same shape as
+    the paginated response, with the count written last, and stream=ndjson
+    writes one JSON object per line instead.
+    """
+    stream_chunk_size = 1000
+
+    def list(self, request, *args, **kwargs):
+        if 'no_pagination' not in request.query_params or request.accepted_renderer.format != 'json':
+            return super(StreamingListMixin, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+
+        if request.query_params.get('stream') == 'ndjson':
+            return StreamingHttpResponse(
+                self.stream_ndjson(queryset), content_type='application/x-ndjson')
+        return StreamingHttpResponse(
+            self.stream_json(queryset), content_type='application/json')
+
+    def iter_serialized_chunks(self, queryset):
+        """Yield lists of serialized objects, one per chunk of rows."""
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+
+        # iterator() skips prefetching, so do it for each chunk instead
+        prefetch_lookups = queryset._prefetch_related_lookups
+
+        objects = queryset.iterator(chunk_size=self.stream_chunk_size)
+        for chunk in iter_chunks(objects, self.stream_chunk_size):
+            prefetch_related_objects(chunk, *prefetch_lookups)
+            yield serializer_class(chunk, many=True, context=context).data
+
+    def stream_ndjson(self, queryset):
+        for data in self.iter_serialized_chunks(queryset):
+            yield ''.join(dump_json(item) + '\n' for item in data)
+
+    def stream_json(self, queryset):
+        count = 0
+        yield '{"results":['
+        for data in self.iter_serialized_chunks(queryset):
+            separator = ',' if count else ''
+            yield separator + ','.join(dump_json(item) for item in data)
+            count += len(data)
+        yield '],"count":{}}}'.format(count)
+
+
+def dump_json(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def iter_chunks(iterable, size):
+    """Yield lists of up to size items from iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class IncrementalRelationsMixin(object):
+    """Add to and remove from many to many relations without replacing them.
+
+    Relations named in incremental_relations can be changed by POSTing to
+    the relations route of an object, for example:
+        {"file_resources": {"add": [1, 2], "remove": [3]}}
+    Keys are validated as by the serializer field for the relation, and only
+    the through rows for the given keys are read and written.
+    """
+    incremental_relations = ()
+
+    def get_relation_fields(self):
+        """Serializer fields to validate relation keys, by relation name."""
+        serializer_fields = self.get_serializer().fields
+        fields = {}
+        for field_name in self.incremental_relations:
+            field = serializer_fields.get(field_name)
+            if field is None or field.read_only:
+                # Relations through a custom model are read only in serializers
+                related_model = self.get_queryset().model._meta.get_field(field_name).related_model
+                field = tantalus.api.serializers.BatchedPrimaryKeyRelatedField(
+                    many=True, queryset=related_model._default_manager.all())
+            fields[field_name] = field
+        return fields
+
+    def add_related(self, instance, field_name, objects):
+        getattr(instance, field_name).add(*objects)
+
+    def remove_related(self, instance, field_name, objects):
+        getattr(instance, field_name).remove(*objects)
+
+    def change_relations(self, instance, changes):
+        """Apply validated changes by relation name, removals first."""
+        for field_name, change in changes.items():
+            if change['remove']:
+                self.remove_related(instance, field_name, change['remove'])
+            if change['add']:
+                self.add_related(instance, field_name, change['add'])
+
+    @detail_route(methods=['post'])
+    def relations(self, request, pk=None):
+        instance = self.get_object()
+        fields = self.get_relation_fields()
+
+        if not isinstance(request.data, dict):
+            raise rest_framework.exceptions.ValidationError('expected an object of relation changes')
+
+        changes = OrderedDict()
+        errors = {}
+        for field_name, change in request.data.items():
+            if field_name not in self.incremental_relations:
+                raise rest_framework.exceptions.ValidationError(
+                    'cannot change {}, expected one of {}'.format(field_name, ', '.join(self.incremental_relations)))
+            if not isinstance(change, dict) or not set(change) <= {'add', 'remove'}:
+                raise rest_framework.exceptions.ValidationError(
+                    '{} changes must be an object with add and remove lists'.format(field_name))
+            changes[field_name] = OrderedDict()
+            for operation in ('add', 'remove'):
+                # Relation fields may not allow empty lists, so only validate given keys
+                if not change.get(operation):
+                    changes[field_name][operation] = []
+                    continue
+                try:
+                    changes[field_name][operation] = fields[field_name].to_internal_value(change[operation])
+                except rest_framework.exceptions.ValidationError as e:
+                    errors.setdefault(field_name, {})[operation] = e.detail
+        if errors:
+            raise rest_framework.exceptions.ValidationError(errors)
+
+        with transaction.atomic():
+            self.change_relations(instance, changes)
+
+        return Response(OrderedDict(
+            (field_name, OrderedDict(
+                (operation, [obj.pk for obj in objects])
+                for operation, objects in change.items()))
+            for field_name, change in changes.items()))
+
 
 class OwnerEditModelViewSet(viewsets.ModelViewSet):
     permission_classes = (
@@ -88,44 +405,59 @@ class OwnerEditModelViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'query'):
             return self.serializer_class_readonly
         return self.serializer_class_readwrite
 
 
-class SampleViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+class SampleViewSet(RestrictedQueryMixin, StreamingListMixin, viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.Sample.objects.all().distinct()
+    queryset = tantalus.models.Sample.objects.all()
     serializer_class = tantalus.api.serializers.SampleSerializer
     filter_class = SampleFilter
     pagination_class = VariableResultsSetPagination
 
 
-class PatientViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+class PatientViewSet(RestrictedQueryMixin, StreamingListMixin, viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.Patient.objects.all().distinct()
+    queryset = tantalus.models.Patient.objects.all()
     serializer_class = tantalus.api.serializers.PatientSerializer
     filter_class = PatientFilter
     pagination_class = VariableResultsSetPagination
 
 
-class FileResourceViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
+class FileResourceViewSet(RestrictedQueryMixin, StreamingListMixin, OwnerEditModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     queryset = tantalus.models.FileResource.objects.all()
     serializer_class_readonly = tantalus.api.serializers.FileResourceSerializerRead
     serializer_class_readwrite = tantalus.api.serializers.FileResourceSerializer
     filter_class = FileResourceFilter
-    pagination_class = VariableResultsSetPagination
-
-
-class FileResourceDetailViewset(RestrictedQueryMixin, viewsets.ReadOnlyModelViewSet):
+    pagination_class = ApproximateCountPagination
+
+    @list_route(methods=['post'])
+    def bulk(self, request):
+        """
+        Register many file resources in one transaction. POST a list in the following JSON format:
+            [{"filename": "a.bam", "size": 1, "created": "2019-01-01T00:00:00Z", "md5": null,
+              "file_instances": [{"storage": "singlecellblob"}],
+              "sequencefileinfo": {"read_end": null, "genome_region": null, "index_sequence": null}}]
+        Existing file resources and file instances are reused, and the response reports per item results.
+        """
+        serializer = tantalus.api.serializers.FileResourceBulkSerializer(
+            data=request.data, many=True, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save(owner=request.user)
+        return Response(results, status=status.HTTP_201_CREATED)
+
+
+class FileResourceDetailViewset(RestrictedQueryMixin, StreamingListMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     queryset = tantalus.models.FileResource.objects.all()
     serializer_class = tantalus.api.serializers.FileResourceInstancesSerilizer
     filter_class = FileResourceFilter
-    pagination_class = VariableResultsSetPagination
+    pagination_class = ApproximateCountPagination
 
-class SequenceFileInfoViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
+class SequenceFileInfoViewSet(RestrictedQueryMixin, StreamingListMixin, OwnerEditModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     queryset = tantalus.models.SequenceFileInfo.objects.all()
     serializer_class_readonly = tantalus.api.serializers.SequenceFileInfoSerializer
@@ -134,31 +466,74 @@ class SequenceFileInfoViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
     pagination_class = VariableResultsSetPagination
 
 
-class DNALibraryViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
+class DNALibraryViewSet(RestrictedQueryMixin, StreamingListMixin, OwnerEditModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.DNALibrary.objects.all().distinct()
+    queryset = tantalus.models.DNALibrary.objects.all()
     serializer_class_readonly = tantalus.api.serializers.DNALibrarySerializer
     serializer_class_readwrite = tantalus.api.serializers.DNALibrarySerializer
     filter_class = DNALibraryFilter
     pagination_class = VariableResultsSetPagination
 
 
-class SequencingLaneViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
+class SequencingLaneViewSet(RestrictedQueryMixin, StreamingListMixin, OwnerEditModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.SequencingLane.objects.all().distinct()
+    queryset = tantalus.models.SequencingLane.objects.all()
     serializer_class_readonly = tantalus.api.serializers.SequencingLaneSerializer
     serializer_class_readwrite = tantalus.api.serializers.SequencingLaneSerializer
     filter_class = SequencingLaneFilter
     pagination_class = VariableResultsSetPagination
 
 
-class SequenceDatasetViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
+class SequenceDatasetViewSet(RestrictedQueryMixin, StreamingListMixin, IncrementalRelationsMixin, OwnerEditModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.SequenceDataset.objects.all().distinct()
+    queryset = tantalus.models.SequenceDataset.objects.all()
     serializer_class_readonly = tantalus.api.serializers.SequenceDatasetSerializerRead
     serializer_class_readwrite = tantalus.api.serializers.SequenceDatasetSerializer
     filter_class = SequenceDatasetFilter
     pagination_class = VariableResultsSetPagination
+    incremental_relations = ('file_resources', 'sequence_lanes', 'tags')
+
+    def get_bundle_dataset(self, data):
+        """Find the dataset with the name and version number of a bundle."""
+        try:
+            return tantalus.models.SequenceDataset.objects.filter(
+                name=data['name'], version_number=int(data.get('version_number', 1))).first()
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @list_route(methods=['post'])
+    def bundle(self, request):
+        """
+        Register a sequence dataset with its lanes, files and tags in one transaction. POST:
+            {"name": "...", "version_number": 1, "dataset_type": "BAM", "sample": "SA123", "library": "A90652A",
+             "sequence_lanes": [{"flowcell_id": "...", "lane_number": "1", "sequencing_centre": "GSC", "read_type": "P"}],
+             "file_resources": [{"filename": "a.bam", "size": 1, "created": "2019-01-01T00:00:00Z",
+                                 "file_instances": [{"storage": "singlecellblob"}], "sequencefileinfo": null}],
+             "tags": ["tag_name"]}
+        A dataset with the same name and version number is returned as is, with status 200, so
+        that retries never duplicate anything.
+        """
+        if not isinstance(request.data, dict):
+            raise rest_framework.exceptions.ValidationError('expected a sequence dataset bundle object')
+
+        dataset = self.get_bundle_dataset(request.data)
+        if dataset is None:
+            serializer = tantalus.api.serializers.SequenceDatasetBundleSerializer(
+                data=request.data, context=self.get_serializer_context())
+            serializer.is_valid(raise_exception=True)
+            try:
+                dataset = serializer.save(owner=request.user)
+            except IntegrityError:
+                # A concurrent request registered the same dataset first
+                dataset = self.get_bundle_dataset(request.data)
+                if dataset is None:
+                    raise
+            else:
+                return Response(
+                    tantalus.api.serializers.SequenceDatasetSerializer(dataset).data,
+                    status=status.HTTP_201_CREATED)
+
+        return Response(tantalus.api.serializers.SequenceDatasetSerializer(dataset).data)
 
 
     def destroy(self, request, pk=None):
@@ -174,77 +549,120 @@ class SequenceDatasetViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
         return super(SequenceDatasetViewSet, self).destroy(request, pk)
 
 
-class StorageViewSet(RestrictedQueryMixin, viewsets.ReadOnlyModelViewSet):
+class StorageViewSet(RestrictedQueryMixin, StreamingListMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.Storage.objects.all().distinct()
+    queryset = tantalus.models.Storage.objects.all()
     serializer_class = tantalus.api.serializers.StorageSerializer
     filter_class = StorageFilter
     pagination_class = VariableResultsSetPagination
 
 
-class ServerStorageViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+class ServerStorageViewSet(RestrictedQueryMixin, StreamingListMixin, viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.ServerStorage.objects.all().distinct()
+    queryset = tantalus.models.ServerStorage.objects.all()
     serializer_class = tantalus.api.serializers.ServerStorageSerializer
     filter_class = ServerStorageFilter
     pagination_class = VariableResultsSetPagination
 
 
-class AzureBlobStorageViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+class AzureBlobStorageViewSet(RestrictedQueryMixin, StreamingListMixin, viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.AzureBlobStorage.objects.all().distinct()
+    queryset = tantalus.models.AzureBlobStorage.objects.all()
     serializer_class = tantalus.api.serializers.AzureBlobStorageSerializer
     pagination_class = VariableResultsSetPagination
 
 
-class AwsS3StorageViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+class AwsS3StorageViewSet(RestrictedQueryMixin, StreamingListMixin, viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.AwsS3Storage.objects.all().distinct()
+    queryset = tantalus.models.AwsS3Storage.objects.all()
     serializer_class = tantalus.api.serializers.AwsS3StorageSerializer
 
 
-class FileInstanceViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
+class FileInstanceViewSet(RestrictedQueryMixin, StreamingListMixin, OwnerEditModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     queryset = tantalus.models.FileInstance.objects.all()
     serializer_class_readonly = tantalus.api.serializers.FileInstanceSerializerRead
     serializer_class_readwrite = tantalus.api.serializers.FileInstanceSerializer
     filter_class = FileInstanceFilter
-    pagination_class = VariableResultsSetPagination
+    pagination_class = ApproximateCountPagination
 
 
-class Tag(RestrictedQueryMixin, viewsets.ModelViewSet):
+class Tag(RestrictedQueryMixin, StreamingListMixin, viewsets.ModelViewSet):
     """
     To tag datasets in this endpoint, use the following JSON format to POST:
         { "name": "test_api_tag", "sequencedataset_set": [1, 2, 3, 4], "resultsdataset_set": [9, 10] }
     Note that a post will update an existing tag by adding it to the given datasets
     """
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.Tag.objects.all().distinct()
+    queryset = tantalus.models.Tag.objects.all()
     serializer_class = tantalus.api.serializers.TagSerializer
     filter_class = TagFilter
     pagination_class = VariableResultsSetPagination
 
-class CurationViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+class CurationViewSet(RestrictedQueryMixin, StreamingListMixin, IncrementalRelationsMixin, viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.Curation.objects.all().distinct()
+    queryset = tantalus.models.Curation.objects.all()
     serializer_class = tantalus.api.serializers.CurationSerializer
     filter_class = CurationFilter
     pagination_class = VariableResultsSetPagination
-
-class CurationDatasetViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+    incremental_relations = ('sequencedatasets',)
+
+    def change_relations(self, instance, changes):
+        """Change the datasets of a curation as CurationEdit does.
+
+        A change bumps the major version of the curation. Removed datasets
+        are deleted with history at the old version and added datasets are
+        created with history at the new one, which is how
+        get_curation_change finds the edits of each version. Kept datasets
+        move to the new version without history rows, which it does not read.
+        """
+        change = changes['sequencedatasets']
+        curation_datasets = tantalus.models.CurationDataset.objects.filter(curation_instance=instance)
+        current = set(curation_datasets.values_list('sequencedataset_instance_id', flat=True))
+        remove = {dataset.pk for dataset in change['remove']}
+        add = {dataset.pk: dataset for dataset in change['add']}
+        final = (current - remove) | set(add)
+        if final == current:
+            return
+
+        previous_version = instance.version
+        instance.version = "v" + str(int(previous_version[1:].split(".")[0]) + 1) + ".0.0"
+        instance.user = self.request.user
+        instance._history_user = self.request.user
+
+        for curation_dataset in curation_datasets.filter(sequencedataset_instance_id__in=current - final):
+            curation_dataset._history_user = self.request.user
+            curation_dataset.delete()
+
+        curation_datasets.filter(sequencedataset_instance_id__in=current & final).update(version=instance.version)
+
+        new_curation_datasets = []
+        for pk in final - current:
+            curation_dataset = tantalus.models.CurationDataset(
+                curation_instance=instance,
+                sequencedataset_instance=add[pk],
+                version=instance.version)
+            curation_dataset._history_user = self.request.user
+            new_curation_datasets.append(curation_dataset)
+        bulk_create_with_history(new_curation_datasets, tantalus.models.CurationDataset)
+
+        instance.save()
+
+class CurationDatasetViewSet(RestrictedQueryMixin, StreamingListMixin, viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.CurationDataset.objects.all().distinct()
+    queryset = tantalus.models.CurationDataset.objects.all()
     serializer_class = tantalus.api.serializers.CurationDatasetSerializer
     filter_class = CurationDatasetFilter
     pagination_class = VariableResultsSetPagination
 
-class ResultsDatasetViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
+class ResultsDatasetViewSet(RestrictedQueryMixin, StreamingListMixin, IncrementalRelationsMixin, OwnerEditModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.ResultsDataset.objects.all().distinct()
+    queryset = tantalus.models.ResultsDataset.objects.all()
     serializer_class_readonly = tantalus.api.serializers.ResultsDatasetSerializerRead
     serializer_class_readwrite = tantalus.api.serializers.ResultsDatasetSerializer
     filter_class = ResultsDatasetFilter
     pagination_class = VariableResultsSetPagination
+    incremental_relations = ('file_resources', 'samples', 'libraries', 'tags')
 
     def destroy(self, request, pk=None):
         """Delete all associated file resources too."""
@@ -259,10 +677,202 @@ class ResultsDatasetViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
         return super(ResultsDatasetViewSet, self).destroy(request, pk)
 
 
-class AnalysisViewSet(RestrictedQueryMixin, OwnerEditModelViewSet):
+class AnalysisViewSet(RestrictedQueryMixin, StreamingListMixin, IncrementalRelationsMixin, OwnerEditModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
-    queryset = tantalus.models.Analysis.objects.all().distinct()
+    queryset = tantalus.models.Analysis.objects.all()
     serializer_class_readonly = tantalus.api.serializers.AnalysisSerializer
     serializer_class_readwrite = tantalus.api.serializers.AnalysisSerializer
     filter_class = AnalysisFilter
     pagination_class = VariableResultsSetPagination
+    incremental_relations = ('input_datasets', 'input_results', 'logs')
+
+
+def get_storage_id(name):
+    """Look up a storage id by name in the storage cache.
+
+    Reloads the cache on a miss, like get_storage, in case the storage was
+    created by another process.
+    """
+    for reload in (False, True):
+        if reload:
+            tantalus.models.clear_storage_cache()
+        for storage in tantalus.models.get_storages().values():
+            if storage.name == name:
+                return storage.id
+    raise rest_framework.exceptions.ValidationError('storage {} does not exist'.format(name))
+
+
+def get_dataset_scope(query_params):
+    """Read the dataset, tag or analysis a file listing is restricted to."""
+    scope = {}
+    for param in ('sequencedataset', 'resultsdataset', 'analysis'):
+        if param in query_params:
+            try:
+                scope[param] = int(query_params[param])
+            except ValueError:
+                raise rest_framework.exceptions.ValidationError('{} must be an id'.format(param))
+    if 'tag' in query_params:
+        scope['tag'] = query_params['tag']
+    return scope
+
+
+class FileManifestView(APIView):
+    """
+    Stream the files of a dataset, tag or analysis on a storage.
+
+    Takes a storage name and one or more of sequencedataset, resultsdataset,
+    analysis (ids) and tag (name), for example:
+        /api/manifest/?sequencedataset=1&storage=singlecellblob
+    Each file is written as filename, size, md5, filepath and created, as TSV
+    with a header row by default or as NDJSON with output=ndjson.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    manifest_fields = ('filename', 'size', 'md5', 'filepath', 'created')
+    chunk_size = 1000
+
+    def get(self, request):
+        if 'storage' not in request.query_params:
+            raise rest_framework.exceptions.ValidationError('storage is required')
+        storage_id = get_storage_id(request.query_params['storage'])
+
+        scope = get_dataset_scope(request.query_params)
+        if not scope:
+            raise rest_framework.exceptions.ValidationError(
+                'one of sequencedataset, resultsdataset, analysis or tag is required')
+
+        rows = (
+            tantalus.models.FileInstance.objects
+            .filter(storage_id=storage_id, is_deleted=False)
+            .filter_datasets(**scope)
+            .annotate_filepath()
+            .order_by('file_resource__filename')
+            .values_list(
+                'file_resource__filename',
+                'file_resource__size',
+                'file_resource__md5',
+                'filepath',
+                'file_resource__created')
+            .iterator(chunk_size=self.chunk_size))
+
+        if request.query_params.get('output') == 'ndjson':
+            return StreamingHttpResponse(self.stream_ndjson(rows), content_type='application/x-ndjson')
+        return StreamingHttpResponse(self.stream_tsv(rows), content_type='text/tab-separated-values')
+
+    def stream_tsv(self, rows):
+        yield '\t'.join(self.manifest_fields) + '\n'
+        for chunk in iter_chunks(rows, self.chunk_size):
+            yield ''.join(
+                '{}\t{}\t{}\t{}\t{}\n'.format(filename, size, md5 or '', filepath, created.isoformat())
+                for filename, size, md5, filepath, created in chunk)
+
+    def stream_ndjson(self, rows):
+        for chunk in iter_chunks(rows, self.chunk_size):
+            yield ''.join(
+                dump_json(dict(zip(self.manifest_fields, row))) + '\n'
+                for row in chunk)
+
+
+class StorageDiffView(APIView):
+    """
+    Stream the files on a source storage that are missing from a destination storage.
+
+    Takes source and destination storage names, and optionally restricts
+    the files to a sequencedataset, resultsdataset, analysis or tag as for
+    the manifest, for example:
+        /api/storage_diff/?source=shahlab&destination=singlecellblob&tag=SC-1234
+    Returns the missing files as JSON with the file resource id, filename,
+    size, md5 and source filepath of each, followed by the number of files
+    and their total size in bytes.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    diff_fields = ('id', 'filename', 'size', 'md5', 'filepath')
+    chunk_size = 1000
+
+    def get(self, request):
+        for param in ('source', 'destination'):
+            if param not in request.query_params:
+                raise rest_framework.exceptions.ValidationError('{} is required'.format(param))
+        source_id = get_storage_id(request.query_params['source'])
+        destination_id = get_storage_id(request.query_params['destination'])
+
+        rows = (
+            tantalus.models.FileInstance.objects
+            .filter(storage_id=source_id, is_deleted=False)
+            .filter_datasets(**get_dataset_scope(request.query_params))
+            .missing_from(destination_id)
+            .annotate_filepath()
+            .order_by('file_resource_id')
+            .values_list(
+                'file_resource_id',
+                'file_resource__filename',
+                'file_resource__size',
+                'file_resource__md5',
+                'filepath')
+            .iterator(chunk_size=self.chunk_size))
+
+        return StreamingHttpResponse(self.stream_json(rows), content_type='application/json')
+
+    def stream_json(self, rows):
+        count = 0
+        total_bytes = 0
+        yield '{"results":['
+        for chunk in iter_chunks(rows, self.chunk_size):
+            separator = ',' if count else ''
+            yield separator + ','.join(dump_json(dict(zip(self.diff_fields, row))) for row in chunk)
+            count += len(chunk)
+            total_bytes += sum(row[2] for row in chunk)
+        yield '],"count":{},"total_bytes":{}}}'.format(count, total_bytes)
+
+
+NATURAL_KEYS = OrderedDict([
+    ('sample', (tantalus.models.Sample, 'sample_id')),
+    ('dna_library', (tantalus.models.DNALibrary, 'library_id')),
+    ('file_resource', (tantalus.models.FileResource, 'filename')),
+    ('storage', (tantalus.models.Storage, 'name')),
+    ('tag', (tantalus.models.Tag, 'name')),
+])
+
+
+def resolve_natural_keys(model, field_name, keys):
+    """Map natural keys of a model to primary keys in one query."""
+    queryset = model.objects.all()
+    if hasattr(queryset, 'non_polymorphic'):
+        queryset = queryset.non_polymorphic()
+    return dict(
+        queryset
+        .filter(**{field_name + '__any': list(keys)})
+        .values_list(field_name, 'pk'))
+
+
+class NaturalKeyResolverView(APIView):
+    """
+    Resolve natural keys to primary keys for several models at once. POST lists of keys by model:
+        {"sample": ["SA123", "SA456"], "dna_library": ["A90652A"], "storage": ["singlecellblob"]}
+    Returns the keys found with their primary keys, and the keys missing, for each model:
+        {"sample": {"found": {"SA123": 1}, "missing": ["SA456"]}, ...}
+    Models are sample (sample_id), dna_library (library_id), file_resource (filename),
+    storage (name) and tag (name).
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            raise rest_framework.exceptions.ValidationError('expected an object of key lists')
+
+        results = OrderedDict()
+        for model_name, keys in request.data.items():
+            if model_name not in NATURAL_KEYS:
+                raise rest_framework.exceptions.ValidationError(
+                    'cannot resolve {}, expected one of {}'.format(model_name, ', '.join(NATURAL_KEYS)))
+            if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+                raise rest_framework.exceptions.ValidationError(
+                    '{} keys must be a list of strings'.format(model_name))
+
+            model, field_name = NATURAL_KEYS[model_name]
+            found = resolve_natural_keys(model, field_name, set(keys))
+            results[model_name] = OrderedDict([
+                ('found', found),
+                ('missing', sorted(set(keys) - set(found))),
+            ])
+
+        return Response(results)
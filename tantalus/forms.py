@@ -614,7 +614,7 @@ class DatasetSearchForm(forms.Form):
             results = results.filter(library__index_format=index_format)
 
         if min_num_read_groups is not None:
-            results = results.annotate(sequence_lanes__lane_number=Count('sequence_lanes__lane_number')).filter(sequence_lanes__lane_number__gte=min_num_read_groups)
+            results = results.filter(num_sequence_lanes__gte=min_num_read_groups)
 
         if flowcell_id_and_lane:
             query = Q()
@@ -640,7 +640,7 @@ class DatasetSearchForm(forms.Form):
             print(read_group_match)
             if  read_group_match:
                 print(read_group_match)
-                results = results.annotate(num_read_group=Count('sequence_lanes', distinct=True),total_num_read_group=Count('library__sequencinglane',distinct=True)).filter(num_read_group=F('total_num_read_group'))
+                results = results.filter(is_complete=True)
         if analysis_version:
             results = results.filter(analysis__version__icontains=analysis_version)
         if from_last_updated_date:
@@ -679,7 +679,9 @@ class DatasetTagForm(forms.Form):
     def add_dataset_tags(self):
         tag_name = self.cleaned_data['tag_name']
         tag, created = tantalus.models.Tag.objects.get_or_create(name=tag_name)
-        tag.sequencedataset_set.add(*self.models_to_tag)
+        tag.add_datasets(
+            tantalus.models.SequenceDataset,
+            self.models_to_tag.values_list('pk', flat=True))
 
 class DatasetForm(forms.ModelForm):
     library = forms.CharField(max_length=500)
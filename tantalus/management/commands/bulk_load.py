@@ -0,0 +1,252 @@
+import csv
+import io
+import itertools
+import json
+import os
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+import account.models
+import tantalus.models
+
+
+def through_table(field):
+    """Table and columns of the through table of a many to many field."""
+    return (
+        field.remote_field.through._meta.db_table,
+        field.m2m_column_name(),
+        field.m2m_reverse_name(),
+    )
+
+
+def get_kinds():
+    """Manifest kinds, with their columns and the SQL merging them from the staging table.
+
+    Merges are INSERT ... SELECT statements from bulk_load_stage, which has
+    a text column for each manifest column, and take the owner id as a
+    parameter where the table has an owner. Rows which already exist are
+    skipped, as are rows whose file resource, storage or dataset does not
+    exist.
+    """
+    tables = {
+        'fileresource': tantalus.models.FileResource._meta.db_table,
+        'fileinstance': tantalus.models.FileInstance._meta.db_table,
+        'sequencefileinfo': tantalus.models.SequenceFileInfo._meta.db_table,
+        'storage': tantalus.models.Storage._meta.db_table,
+        'sequencedataset': tantalus.models.SequenceDataset._meta.db_table,
+        'resultsdataset': tantalus.models.ResultsDataset._meta.db_table,
+    }
+
+    kinds = {
+        'file_resource': {
+            'model': tantalus.models.FileResource,
+            'columns': ('filename', 'size', 'created', 'md5', 'is_folder'),
+            'required': ('filename', 'size', 'created'),
+            'merge': '''
+                INSERT INTO {fileresource} (filename, size, created, md5, is_folder, last_updated, owner_id)
+                SELECT stage.filename, stage.size::bigint, stage.created::timestamptz,
+                    NULLIF(stage.md5, ''), COALESCE(NULLIF(stage.is_folder, '')::boolean, false), now(), %s
+                FROM bulk_load_stage stage
+                ON CONFLICT (filename) DO NOTHING
+                RETURNING id
+            ''',
+        },
+        'file_instance': {
+            'model': tantalus.models.FileInstance,
+            'columns': ('filename', 'storage', 'is_deleted'),
+            'required': ('filename', 'storage'),
+            'merge': '''
+                INSERT INTO {fileinstance} (file_resource_id, storage_id, is_deleted, owner_id)
+                SELECT file_resource.id, storage.id, COALESCE(NULLIF(stage.is_deleted, '')::boolean, false), %s
+                FROM bulk_load_stage stage
+                JOIN {fileresource} file_resource ON file_resource.filename = stage.filename
+                JOIN {storage} storage ON storage.name = stage.storage
+                ON CONFLICT (file_resource_id, storage_id) DO NOTHING
+                RETURNING id
+            ''',
+        },
+        'sequence_file_info': {
+            'model': tantalus.models.SequenceFileInfo,
+            'columns': ('filename', 'read_end', 'genome_region', 'index_sequence'),
+            'required': ('filename',),
+            'merge': '''
+                INSERT INTO {sequencefileinfo} (file_resource_id, read_end, genome_region, index_sequence, owner_id)
+                SELECT file_resource.id, NULLIF(stage.read_end, '')::smallint,
+                    NULLIF(stage.genome_region, ''), NULLIF(stage.index_sequence, ''), %s
+                FROM bulk_load_stage stage
+                JOIN {fileresource} file_resource ON file_resource.filename = stage.filename
+                ON CONFLICT (file_resource_id) DO NOTHING
+                RETURNING id
+            ''',
+        },
+    }
+
+    for dataset_type, dataset_model in (
+            ('sequencedataset', tantalus.models.SequenceDataset),
+            ('resultsdataset', tantalus.models.ResultsDataset)):
+        table, dataset_column, file_resource_column = through_table(
+            dataset_model._meta.get_field('file_resources'))
+        kinds[dataset_type + '_file'] = {
+            'model': None,
+            'columns': ('dataset', 'filename'),
+            'required': ('dataset', 'filename'),
+            # Through rows have no owner or history
+            'merge': '''
+                INSERT INTO {table} ({dataset_column}, {file_resource_column})
+                SELECT dataset.id, file_resource.id
+                FROM bulk_load_stage stage
+                JOIN {dataset_table} dataset ON dataset.id = stage.dataset::integer
+                JOIN {{fileresource}} file_resource ON file_resource.filename = stage.filename
+                ON CONFLICT ({dataset_column}, {file_resource_column}) DO NOTHING
+                RETURNING id
+            '''.format(
+                table=table,
+                dataset_column=dataset_column,
+                file_resource_column=file_resource_column,
+                dataset_table=tables[dataset_type]),
+        }
+
+    for kind in kinds.values():
+        kind['merge'] = kind['merge'].format(**tables)
+
+    return kinds
+
+
+def read_manifest(path, manifest_format):
+    """Yield manifest rows as dicts."""
+    with open(path, newline='') as manifest:
+        if manifest_format == 'ndjson':
+            for line in manifest:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            delimiter = '\t' if manifest_format == 'tsv' else ','
+            for row in csv.DictReader(manifest, delimiter=delimiter):
+                yield row
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a CSV, TSV or NDJSON manifest of file resources, file instances, '
+        'sequence file infos or dataset files, staging rows with COPY and merging '
+        'them into the tables with INSERT ... ON CONFLICT DO NOTHING'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kind', choices=sorted(get_kinds()),
+            help='What the manifest rows are. Dataset files rows are a dataset id and a filename.',
+        )
+        parser.add_argument('manifest', help='Path of the manifest.')
+        parser.add_argument(
+            '--format', dest='manifest_format', choices=('csv', 'tsv', 'ndjson'), default=None,
+            help='Manifest format, by default from the file extension.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=50000,
+            help='Rows staged and merged per transaction.',
+        )
+        parser.add_argument(
+            '--checkpoint', default=None,
+            help='File recording the rows loaded so far, to resume an interrupted load from.',
+        )
+        parser.add_argument(
+            '--owner', default=None,
+            help='Username of the owner of the loaded rows.',
+        )
+        parser.add_argument(
+            '--no-history', dest='history', default=True, action='store_false',
+            help='Do not create history rows for the loaded rows.',
+        )
+
+    def read_checkpoint(self, path, options):
+        if path is None or not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint['manifest'] != os.path.abspath(options['manifest']) or checkpoint['kind'] != options['kind']:
+            raise CommandError('checkpoint {} is for another manifest'.format(path))
+        return checkpoint['rows']
+
+    def write_checkpoint(self, path, options, rows):
+        if path is None:
+            return
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'manifest': os.path.abspath(options['manifest']), 'kind': options['kind'], 'rows': rows}, f)
+        os.replace(path + '.tmp', path)
+
+    def load_batch(self, kind, rows, owner, history):
+        """Stage and merge a batch of rows in one transaction, returning the number inserted."""
+        data = io.StringIO()
+        writer = csv.writer(data)
+        for row in rows:
+            writer.writerow([format_value(row.get(column)) for column in kind['columns']])
+        data.seek(0)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE bulk_load_stage ({}) ON COMMIT DROP'.format(
+                ', '.join('{} text'.format(column) for column in kind['columns'])))
+            cursor.copy_expert('COPY bulk_load_stage ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                ', '.join(kind['columns'])), data)
+
+            owner_id = owner.id if owner is not None else None
+            cursor.execute(kind['merge'], [owner_id] * kind['merge'].count('%s'))
+            ids = [row[0] for row in cursor.fetchall()]
+
+            if history and kind['model'] is not None and ids:
+                objs = list(kind['model'].objects.filter(pk__any=ids))
+                for obj in objs:
+                    obj._history_user = owner
+                kind['model'].history.bulk_history_create(objs)
+
+        return len(ids)
+
+    def handle(self, *args, **options):
+        kind = get_kinds()[options['kind']]
+
+        manifest_format = options['manifest_format']
+        if manifest_format is None:
+            manifest_format = os.path.splitext(options['manifest'])[1].lstrip('.').lower()
+            if manifest_format not in ('csv', 'tsv', 'ndjson'):
+                raise CommandError('cannot tell the format of {}, use --format'.format(options['manifest']))
+
+        owner = None
+        if options['owner'] is not None:
+            try:
+                owner = account.models.User.objects.get(username=options['owner'])
+            except account.models.User.DoesNotExist:
+                raise CommandError('user {} does not exist'.format(options['owner']))
+
+        loaded = self.read_checkpoint(options['checkpoint'], options)
+        if loaded:
+            self.stdout.write('Resuming after {} rows'.format(loaded))
+
+        rows = itertools.islice(read_manifest(options['manifest'], manifest_format), loaded, None)
+
+        inserted = 0
+        while True:
+            batch = list(itertools.islice(rows, options['batch_size']))
+            if not batch:
+                break
+
+            for row_number, row in enumerate(batch, loaded + 1):
+                missing = [column for column in kind['required'] if row.get(column) in (None, '')]
+                if missing:
+                    raise CommandError('row {} has no {}'.format(row_number, ', '.join(missing)))
+
+            batch_inserted = self.load_batch(kind, batch, owner, options['history'])
+            loaded += len(batch)
+            inserted += batch_inserted
+            self.write_checkpoint(options['checkpoint'], options, loaded)
+            self.stdout.write('Loaded {} rows, inserted {}'.format(loaded, batch_inserted))
+
+        self.stdout.write('Inserted {} rows, others existed or refer to missing rows'.format(inserted))
@@ -0,0 +1,35 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import BaseCommand
+from django.db import transaction
+
+import tantalus.models
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search documents of every searched object'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Objects whose documents are rebuilt per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        for model in tantalus.models.SEARCH_DOCUMENT_FIELDS:
+            content_type = ContentType.objects.get_for_model(model)
+
+            orphans, _ = (
+                tantalus.models.SearchDocument.objects
+                .filter(content_type=content_type)
+                .exclude(object_id__in=model.objects.values('pk'))
+                .delete())
+
+            pks = list(model.objects.order_by('pk').values_list('pk', flat=True))
+            for start in range(0, len(pks), batch_size):
+                with transaction.atomic():
+                    tantalus.models.refresh_search_documents({model: pks[start:start + batch_size]})
+
+            self.stdout.write('{}: rebuilt {} documents, removed {} orphans'.format(
+                model.__name__, len(pks), orphans))
@@ -0,0 +1,61 @@
+from django.core.management import BaseCommand, CommandError
+
+import tantalus.models
+
+
+class Command(BaseCommand):
+    help = 'List the files on a source storage that are missing from a destination storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Name of the storage to copy from.')
+        parser.add_argument('destination', help='Name of the storage to copy to.')
+        parser.add_argument(
+            '--sequencedataset', type=int, default=None,
+            help='Only consider files of this sequence dataset id.',
+        )
+        parser.add_argument(
+            '--resultsdataset', type=int, default=None,
+            help='Only consider files of this results dataset id.',
+        )
+        parser.add_argument(
+            '--analysis', type=int, default=None,
+            help='Only consider files of datasets output by this analysis id.',
+        )
+        parser.add_argument(
+            '--tag', default=None,
+            help='Only consider files of datasets with this tag name.',
+        )
+
+    def get_storage_id(self, name):
+        try:
+            return tantalus.models.Storage.objects.get(name=name).id
+        except tantalus.models.Storage.DoesNotExist:
+            raise CommandError('storage {} does not exist'.format(name))
+
+    def handle(self, *args, **options):
+        source_id = self.get_storage_id(options['source'])
+        destination_id = self.get_storage_id(options['destination'])
+
+        rows = (
+            tantalus.models.FileInstance.objects
+            .filter(storage_id=source_id, is_deleted=False)
+            .filter_datasets(
+                sequencedataset=options['sequencedataset'],
+                resultsdataset=options['resultsdataset'],
+                analysis=options['analysis'],
+                tag=options['tag'])
+            .missing_from(destination_id)
+            .annotate_filepath()
+            .order_by('file_resource_id')
+            .values_list('file_resource__filename', 'file_resource__size', 'filepath')
+            .iterator())
+
+        count = 0
+        total_bytes = 0
+        for filename, size, filepath in rows:
+            self.stdout.write('{}\t{}\t{}'.format(filename, size, filepath))
+            count += 1
+            total_bytes += size
+
+        self.stderr.write('{} files, {} bytes missing from {}'.format(
+            count, total_bytes, options['destination']))
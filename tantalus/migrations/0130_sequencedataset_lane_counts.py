@@ -0,0 +1,65 @@
+# Generated by Django 2.2 on 2026-10-18 10:12
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+
+def set_lane_counts(apps, schema_editor):
+    SequenceDataset = apps.get_model('tantalus', 'SequenceDataset')
+    SequencingLane = apps.get_model('tantalus', 'SequencingLane')
+
+    dataset_lanes = (
+        SequenceDataset.sequence_lanes.through.objects
+        .filter(sequencedataset=OuterRef('pk'))
+        .order_by()
+        .values('sequencedataset')
+        .annotate(count=Count('*'))
+        .values('count'))
+
+    library_lanes = (
+        SequencingLane.objects
+        .filter(dna_library=OuterRef('library'))
+        .order_by()
+        .values('dna_library')
+        .annotate(count=Count('*'))
+        .values('count'))
+
+    SequenceDataset.objects.update(
+        num_sequence_lanes=Coalesce(Subquery(dataset_lanes, output_field=models.IntegerField()), 0),
+        num_total_sequence_lanes=Coalesce(Subquery(library_lanes, output_field=models.IntegerField()), 0),
+    )
+
+    SequenceDataset.objects.update(
+        is_complete=Case(
+            When(num_sequence_lanes=F('num_total_sequence_lanes'), then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tantalus', '0129_auto_20200301_1408'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sequencedataset',
+            name='is_complete',
+            field=models.BooleanField(db_index=True, default=False, editable=False, help_text="Whether the dataset includes all sequencing lanes of its library."),
+        ),
+        migrations.AddField(
+            model_name='sequencedataset',
+            name='num_sequence_lanes',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Number of sequencing lanes in the dataset.'),
+        ),
+        migrations.AddField(
+            model_name='sequencedataset',
+            name='num_total_sequence_lanes',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text="Number of sequencing lanes of the dataset's library."),
+        ),
+        migrations.RunPython(set_lane_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 2.2 on 2026-10-18 14:36
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Search document fields as of this migration
+SEARCH_DOCUMENT_FIELDS = [
+    ('Patient', ['patient_id', 'reference_id', 'external_patient_id', 'patient_id', 'sample__sample_id']),
+    ('Sample', ['sample_id', 'projects__name', 'external_sample_id', 'submitter', 'researcher', 'tissue', 'note', 'patient__patient_id']),
+    ('SequenceDataset', [
+        'sample__sample_id', 'sample__external_sample_id', 'sample__tissue', 'sample__note',
+        'library__library_id', 'library__library_type', 'sequence_lanes__flowcell_id', 'sequence_lanes__sequencing_centre',
+        'sequence_lanes__sequencing_instrument', 'aligner__name', 'reference_genome__name', 'name', 'dataset_type', 'owner__username']),
+    ('Submission', ['sample__sample_id', 'sow__name', 'submitted_by', 'library_type__name']),
+    ('ResultsDataset', [
+        'name', 'results_type', 'results_version', 'owner__username', 'tags__name',
+        'analysis__name', 'analysis__jira_ticket', 'analysis__status',
+        'samples__sample_id', 'samples__external_sample_id', 'samples__tissue', 'samples__note',
+        'libraries__library_type', 'libraries__library_id', 'inputresults__name']),
+    ('Analysis', ['analysis_type', 'owner__username', 'name', 'jira_ticket', 'version', 'status', 'input_datasets__name', 'input_results__name']),
+    ('Tag', ['name', 'owner__username', 'sequencedataset__name', 'resultsdataset__name']),
+]
+
+BATCH_SIZE = 1000
+
+
+def create_search_documents(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    SearchDocument = apps.get_model('tantalus', 'SearchDocument')
+
+    for model_name, paths in SEARCH_DOCUMENT_FIELDS:
+        model = apps.get_model('tantalus', model_name)
+        content_type, _ = ContentType.objects.get_or_create(
+            app_label='tantalus', model=model_name.lower())
+
+        pks = list(model.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(pks), BATCH_SIZE):
+            batch = pks[start:start + BATCH_SIZE]
+            texts = {pk: {} for pk in batch}
+            for path in paths:
+                for pk, value in model.objects.filter(pk__in=batch).values_list('pk', path):
+                    if value is not None and value != '':
+                        texts[pk][str(value)] = None
+
+            SearchDocument.objects.bulk_create([
+                SearchDocument(content_type=content_type, object_id=pk, document=' '.join(values))
+                for pk, values in texts.items()
+            ])
+
+        SearchDocument.objects.filter(content_type=content_type).update(
+            search_vector=SearchVector('document'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('tantalus', '0130_sequencedataset_lane_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('document', models.TextField()),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+            options={
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='tantalus_searchdoc_vector_idx'),
+        ),
+        migrations.RunPython(create_search_documents, migrations.RunPython.noop),
+    ]
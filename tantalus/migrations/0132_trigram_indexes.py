@@ -0,0 +1,48 @@
+# Generated by Django 2.2 on 2026-10-18 15:12
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tantalus', '0131_searchdocument'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='sample',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['sample_id'], name='tantalus_sample_id_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='dnalibrary',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['library_id'], name='tantalus_library_id_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='fileresource',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['filename'], name='tantalus_filename_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='sequencedataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='tantalus_seqdataset_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='analysis',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='tantalus_analysis_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='analysis',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['jira_ticket'], name='tantalus_analysis_jira_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='resultsdataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='tantalus_resdataset_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['document'], name='tantalus_searchdoc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2 on 2026-10-18 16:40
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tantalus', '0132_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tag',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='tantalus_tag_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='librarytype',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='tantalus_libtype_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='sequencedataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['dataset_type'], name='tantalus_seqdataset_type_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='analysistype',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='tantalus_anltype_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='analysis',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['version'], name='tantalus_analysis_version_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='analysis',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['status'], name='tantalus_analysis_status_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='resultsdataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['results_type'], name='tantalus_resdataset_type_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='resultsdataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['results_version'], name='tantalus_resdataset_ver_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -1,20 +1,32 @@
 from __future__ import unicode_literals
 
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
 import django
 import django.contrib.postgres.fields
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchVector, SearchVectorField
+from django.core.cache import caches
+from django.db import connection, models, transaction
 from django.urls import reverse
 from django.core.validators import RegexValidator
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db.models import Max, Sum
+from django.db.models import Case, Count, Exists, F, Func, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Concat
 from simple_history.models import HistoricalRecords
 from polymorphic.models import PolymorphicModel
 import account.models
 from django.db.models import signals
+from django.db.models.constants import LOOKUP_SEP
 from django.dispatch import receiver
+from search_util import search_fields
 
 def create_id_field(*args, **kwargs):
     return models.CharField(
@@ -23,6 +35,124 @@ def create_id_field(*args, **kwargs):
         **kwargs
     )
 
+@models.Field.register_lookup
+class AnyLookup(models.Lookup):
+    """
+    Match any value of a list, sent as a single array parameter.
+
+    Equivalent to in, but as field = ANY(array) rather than with a
+    placeholder per value, for lists of many thousands of values.
+    """
+    lookup_name = 'any'
+
+    def get_prep_lookup(self):
+        return [self.lhs.output_field.get_prep_value(value) for value in self.rhs]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        return '%s = ANY(%%s)' % lhs, list(lhs_params) + [self.rhs]
+
+
+class TrigramPatternLookup(models.Lookup):
+    """
+    Pattern match on the column itself with LIKE or ILIKE.
+
+    The builtin contains, startswith and endswith lookups and their case
+    insensitive variants match on column::text or UPPER(column::text),
+    which trigram (gin_trgm_ops) indexes on the column cannot serve.
+    """
+    operator = 'LIKE'
+    pattern = '%{}%'
+
+    def get_db_prep_lookup(self, value, connection):
+        return '%s', [self.pattern.format(connection.ops.prep_for_like_query(value))]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '%s %s %s' % (lhs, self.operator, rhs), list(lhs_params) + list(rhs_params)
+
+
+@models.CharField.register_lookup
+@models.TextField.register_lookup
+class TrigramContains(TrigramPatternLookup):
+    lookup_name = 'trigram_contains'
+
+
+@models.CharField.register_lookup
+@models.TextField.register_lookup
+class TrigramIContains(TrigramPatternLookup):
+    lookup_name = 'trigram_icontains'
+    operator = 'ILIKE'
+
+
+@models.CharField.register_lookup
+@models.TextField.register_lookup
+class TrigramStartsWith(TrigramPatternLookup):
+    lookup_name = 'trigram_startswith'
+    pattern = '{}%'
+
+
+@models.CharField.register_lookup
+@models.TextField.register_lookup
+class TrigramIStartsWith(TrigramPatternLookup):
+    lookup_name = 'trigram_istartswith'
+    operator = 'ILIKE'
+    pattern = '{}%'
+
+
+@models.CharField.register_lookup
+@models.TextField.register_lookup
+class TrigramEndsWith(TrigramPatternLookup):
+    lookup_name = 'trigram_endswith'
+    pattern = '%{}'
+
+
+@models.CharField.register_lookup
+@models.TextField.register_lookup
+class TrigramIEndsWith(TrigramPatternLookup):
+    lookup_name = 'trigram_iendswith'
+    operator = 'ILIKE'
+    pattern = '%{}'
+
+
+# Builtin pattern lookups and their trigram index friendly equivalents
+TRIGRAM_LOOKUPS = {
+    'contains': 'trigram_contains',
+    'icontains': 'trigram_icontains',
+    'startswith': 'trigram_startswith',
+    'istartswith': 'trigram_istartswith',
+    'endswith': 'trigram_endswith',
+    'iendswith': 'trigram_iendswith',
+}
+
+# Largest value of an integer (AutoField) primary key column
+MAX_INTEGER_PK = 2 ** 31 - 1
+
+
+def trigram_search(model, fields, value, lookup='trigram_icontains', extra_queries=()):
+    """
+    Return a Q matching objects of a model with value matched by the
+    trigram lookup on any of the fields, with value as their primary
+    key if it is a number, or in any of the extra querysets of the model.
+
+    Every field must have a trigram index. Each is matched in its own
+    query on the primary key, and the queries are combined with a union
+    in a single subquery. An OR of the conditions would be filtered row
+    by row over the whole table as soon as one of them, such as a
+    subquery on a related table, could not be served by an index.
+    """
+    queries = [
+        model._default_manager.filter(**{field + LOOKUP_SEP + lookup: value})
+        for field in fields
+    ]
+    if value.isdecimal() and int(value) <= MAX_INTEGER_PK:
+        queries.append(model._default_manager.filter(pk=int(value)))
+    queries.extend(extra_queries)
+    queries = [query.order_by().values('pk') for query in queries]
+    return Q(pk__in=queries[0].union(*queries[1:], all=True))
+
+
 class Tag(models.Model):
     """
     Simple text tag associated with datasets.
@@ -66,6 +196,58 @@ class Tag(models.Model):
     def get_created_date(self):
         return self.history.last().history_date.date().strftime("%Y-%m-%d")
 
+    def _dataset_through(self, dataset_model):
+        """Return the tags through model of a dataset model and its dataset column."""
+        field = dataset_model._meta.get_field('tags')
+        return field.remote_field.through, field.m2m_column_name()
+
+    def _send_datasets_changed(self, dataset_model, action, pk_set):
+        through, _ = self._dataset_through(dataset_model)
+        signals.m2m_changed.send(
+            sender=through, instance=self, action=action, reverse=True,
+            model=dataset_model, pk_set=pk_set, using=self._state.db)
+
+    def add_datasets(self, dataset_model, dataset_ids, batch_size=10000):
+        """Tag datasets by id with bulk inserts, skipping those already tagged.
+
+        Sends a single pre_add/post_add m2m_changed pair for the whole set
+        rather than one per dataset.
+        """
+        pk_set = set(dataset_ids)
+        if not pk_set:
+            return
+        through, column = self._dataset_through(dataset_model)
+        self._send_datasets_changed(dataset_model, 'pre_add', pk_set)
+        through.objects.bulk_create(
+            [through(**{column: pk, 'tag_id': self.pk}) for pk in pk_set],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        self._send_datasets_changed(dataset_model, 'post_add', pk_set)
+
+    def remove_datasets(self, dataset_model, dataset_ids):
+        """Untag datasets by id with a single delete."""
+        pk_set = set(dataset_ids)
+        if not pk_set:
+            return
+        through, column = self._dataset_through(dataset_model)
+        self._send_datasets_changed(dataset_model, 'pre_remove', pk_set)
+        through.objects.filter(**{'tag_id': self.pk, column + '__in': pk_set}).delete()
+        self._send_datasets_changed(dataset_model, 'post_remove', pk_set)
+
+    def set_datasets(self, dataset_model, dataset_ids):
+        """Replace the datasets of a model carrying this tag."""
+        pk_set = set(dataset_ids)
+        through, column = self._dataset_through(dataset_model)
+        current = set(through.objects.filter(tag_id=self.pk).values_list(column, flat=True))
+        self.remove_datasets(dataset_model, current - pk_set)
+        self.add_datasets(dataset_model, pk_set - current)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='tantalus_tag_name_trgm'),
+        ]
+
 
 class Project(models.Model):
     """
@@ -181,6 +363,11 @@ class Sample(models.Model):
     def get_submissions(self):
         return self.submission_set.all()
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['sample_id'], opclasses=['gin_trgm_ops'], name='tantalus_sample_id_trgm'),
+        ]
+
 
 class LibraryType(models.Model):
     """
@@ -206,6 +393,11 @@ class LibraryType(models.Model):
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='tantalus_libtype_name_trgm'),
+        ]
+
 
 class DNALibrary(models.Model):
     """
@@ -248,6 +440,11 @@ class DNALibrary(models.Model):
     def __str__(self):
         return '{}_{}'.format(self.library_type, self.library_id)
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['library_id'], opclasses=['gin_trgm_ops'], name='tantalus_library_id_trgm'),
+        ]
+
 
 class SequencingLane(models.Model):
     """
@@ -378,11 +575,17 @@ class FileResource(models.Model):
         return size_mb
 
     def get_storage_names(self):
-        return list(
+        storage_ids = (
             FileInstance.objects.filter(
                 file_resource=self, is_deleted=False)
-            .values_list('storage__name', flat=True)
+            .values_list('storage_id', flat=True)
             .distinct())
+        return [get_storage(storage_id).name for storage_id in storage_ids]
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['filename'], opclasses=['gin_trgm_ops'], name='tantalus_filename_trgm'),
+        ]
 
 
 class SequenceFileInfo(models.Model):
@@ -461,7 +664,13 @@ class SequenceDataset(models.Model):
     Generalized dataset class.
     """
 
-    history = HistoricalRecords()
+    history = HistoricalRecords(
+        excluded_fields=[
+            'num_sequence_lanes',
+            'num_total_sequence_lanes',
+            'is_complete',
+        ],
+    )
 
     last_updated = models.DateTimeField(
         auto_now=True,
@@ -558,18 +767,42 @@ class SequenceDataset(models.Model):
         blank=True,
     )
 
+    # Denormalized from sequence_lanes and the library's lanes, and kept
+    # current by the signal handlers below update_sequence_lane_counts
+    num_sequence_lanes = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        db_index=True,
+        help_text="Number of sequencing lanes in the dataset.",
+    )
+
+    num_total_sequence_lanes = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        db_index=True,
+        help_text="Number of sequencing lanes of the dataset's library.",
+    )
+
+    is_complete = models.BooleanField(
+        default=False,
+        editable=False,
+        db_index=True,
+        help_text="Whether the dataset includes all sequencing lanes of its library.",
+    )
+
     def get_num_total_sequencing_lanes(self):
-        return SequencingLane.objects.filter(dna_library=self.library).count()
+        return self.num_total_sequence_lanes
 
     def get_is_complete(self):
-        return self.sequence_lanes.all().count() == self.get_num_total_sequencing_lanes()
+        return self.is_complete
 
     def get_storage_names(self):
-        return list(
+        storage_ids = (
             FileInstance.objects.filter(
                 file_resource__sequencedataset=self)
-            .values_list('storage__name', flat=True)
+            .values_list('storage_id', flat=True)
             .distinct())
+        return [get_storage(storage_id).name for storage_id in storage_ids]
 
     def get_dataset_type_name(self):
         return self.dataset_type
@@ -595,8 +828,116 @@ class SequenceDataset(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def next_version_number(cls, name):
+        """
+        Allocate the next version number of a dataset name. Must be called
+        in a transaction, which holds an advisory lock on the name until it
+        ends so that concurrent allocations for the name wait for it.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(hashtext(%s))',
+                ['{}:{}'.format(cls._meta.db_table, name)])
+        latest = cls.objects.filter(name=name).aggregate(Max('version_number'))['version_number__max']
+        return (latest or 0) + 1
+
     class Meta:
         unique_together = ('name', 'version_number')
+        indexes = [
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='tantalus_seqdataset_name_trgm'),
+            GinIndex(fields=['dataset_type'], opclasses=['gin_trgm_ops'], name='tantalus_seqdataset_type_trgm'),
+        ]
+
+
+LANE_COUNT_FIELDS = ('num_sequence_lanes', 'num_total_sequence_lanes', 'is_complete')
+
+
+def update_sequence_lane_counts(datasets):
+    """
+    Recompute stored lane counts and completeness for a SequenceDataset
+    queryset. Runs as two UPDATE statements, without save signals or history.
+    """
+    dataset_lanes = (
+        SequenceDataset.sequence_lanes.through.objects
+        .filter(sequencedataset=OuterRef('pk'))
+        .order_by()
+        .values('sequencedataset')
+        .annotate(count=Count('*'))
+        .values('count'))
+
+    library_lanes = (
+        SequencingLane.objects
+        .filter(dna_library=OuterRef('library'))
+        .order_by()
+        .values('dna_library')
+        .annotate(count=Count('*'))
+        .values('count'))
+
+    datasets.update(
+        num_sequence_lanes=Coalesce(Subquery(dataset_lanes, output_field=models.IntegerField()), 0),
+        num_total_sequence_lanes=Coalesce(Subquery(library_lanes, output_field=models.IntegerField()), 0),
+    )
+
+    # Separate statement, as the right hand side of an UPDATE sees the old row
+    datasets.update(
+        is_complete=Case(
+            When(num_sequence_lanes=F('num_total_sequence_lanes'), then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField(),
+        ),
+    )
+
+
+@receiver(signals.post_save, sender=SequenceDataset)
+def sequence_dataset_saved(sender, instance, **kwargs):
+    # Saving writes the in memory counts, which may be stale, and the
+    # library may have changed
+    update_sequence_lane_counts(SequenceDataset.objects.filter(pk=instance.pk))
+    instance.refresh_from_db(fields=LANE_COUNT_FIELDS)
+
+
+@receiver(signals.m2m_changed, sender=SequenceDataset.sequence_lanes.through)
+def sequence_dataset_lanes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._cleared_sequence_dataset_pks = list(
+            instance.sequencedataset_set.values_list('pk', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        update_sequence_lane_counts(SequenceDataset.objects.filter(pk=instance.pk))
+        instance.refresh_from_db(fields=LANE_COUNT_FIELDS)
+    elif action == 'post_clear':
+        update_sequence_lane_counts(
+            SequenceDataset.objects.filter(pk__in=instance._cleared_sequence_dataset_pks))
+    else:
+        update_sequence_lane_counts(SequenceDataset.objects.filter(pk__in=pk_set))
+
+
+@receiver(signals.pre_save, sender=SequencingLane)
+@receiver(signals.pre_delete, sender=SequencingLane)
+def sequencing_lane_changing(sender, instance, **kwargs):
+    # Remember the previous library and datasets, as both may be gone by
+    # the time the post signal is sent
+    if instance.pk is None:
+        return
+    instance._previous_dna_library_ids = list(
+        SequencingLane.objects.filter(pk=instance.pk).values_list('dna_library_id', flat=True))
+    instance._previous_sequence_dataset_pks = list(
+        SequenceDataset.objects.filter(sequence_lanes__pk=instance.pk).values_list('pk', flat=True))
+
+
+@receiver(signals.post_save, sender=SequencingLane)
+@receiver(signals.post_delete, sender=SequencingLane)
+def sequencing_lane_changed(sender, instance, **kwargs):
+    library_ids = set(getattr(instance, '_previous_dna_library_ids', ()))
+    library_ids.add(instance.dna_library_id)
+    update_sequence_lane_counts(SequenceDataset.objects.filter(
+        Q(library_id__in=library_ids) |
+        Q(pk__in=getattr(instance, '_previous_sequence_dataset_pks', ()))))
 
 
 class AnalysisType(models.Model):
@@ -613,6 +954,11 @@ class AnalysisType(models.Model):
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='tantalus_anltype_name_trgm'),
+        ]
+
 
 # Validator for analysis version
 analysis_version_validator = RegexValidator(
@@ -703,6 +1049,12 @@ class Analysis(models.Model):
 
     class Meta:
         unique_together = ('name', 'jira_ticket')
+        indexes = [
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='tantalus_analysis_name_trgm'),
+            GinIndex(fields=['jira_ticket'], opclasses=['gin_trgm_ops'], name='tantalus_analysis_jira_trgm'),
+            GinIndex(fields=['version'], opclasses=['gin_trgm_ops'], name='tantalus_analysis_version_trgm'),
+            GinIndex(fields=['status'], opclasses=['gin_trgm_ops'], name='tantalus_analysis_status_trgm'),
+        ]
 
 
 class ResultsDataset(models.Model):
@@ -769,6 +1121,13 @@ class ResultsDataset(models.Model):
     def __str__(self):
         return str(self.name)
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='tantalus_resdataset_name_trgm'),
+            GinIndex(fields=['results_type'], opclasses=['gin_trgm_ops'], name='tantalus_resdataset_type_trgm'),
+            GinIndex(fields=['results_version'], opclasses=['gin_trgm_ops'], name='tantalus_resdataset_ver_trgm'),
+        ]
+
 
 class Storage(PolymorphicModel):
     """
@@ -883,11 +1242,169 @@ class AwsS3Storage(Storage):
         return blobpath
 
 
+# Storages are few and rarely change, but are needed for every file
+# instance that is listed. Keep them in memory, downcast to their storage
+# type, and reload when a storage is saved or deleted in this process, when
+# an unknown id is requested, or after STORAGE_CACHE_TIMEOUT seconds so that
+# changes made by other processes are picked up.
+STORAGE_CACHE_TIMEOUT = 300
+
+_storage_cache = {'storages': None, 'loaded': 0}
+_storage_cache_lock = threading.Lock()
+
+
+def get_storages():
+    """
+    Return all storages by id from the storage cache.
+    """
+    with _storage_cache_lock:
+        storages = _storage_cache['storages']
+        if storages is None or time.monotonic() - _storage_cache['loaded'] > STORAGE_CACHE_TIMEOUT:
+            storages = {storage.id: storage for storage in Storage.objects.all()}
+            _storage_cache['storages'] = storages
+            _storage_cache['loaded'] = time.monotonic()
+        return storages
+
+
+def get_storage(storage_id):
+    """
+    Return a storage by id from the storage cache.
+    """
+    storages = get_storages()
+    if storage_id not in storages:
+        clear_storage_cache()
+        storages = get_storages()
+    return storages[storage_id]
+
+
+def clear_storage_cache():
+    with _storage_cache_lock:
+        _storage_cache['storages'] = None
+
+
+@receiver(signals.post_save, sender=Storage)
+@receiver(signals.post_save, sender=ServerStorage)
+@receiver(signals.post_save, sender=AzureBlobStorage)
+@receiver(signals.post_save, sender=AwsS3Storage)
+@receiver(signals.post_delete, sender=Storage)
+@receiver(signals.post_delete, sender=ServerStorage)
+@receiver(signals.post_delete, sender=AzureBlobStorage)
+@receiver(signals.post_delete, sender=AwsS3Storage)
+def storage_changed(sender, **kwargs):
+    clear_storage_cache()
+
+
+class StripSlashes(Func):
+    """
+    SQL equivalent of str.strip('/').
+    """
+    function = 'BTRIM'
+    template = "%(function)s(%(expressions)s, '/')"
+    output_field = models.CharField()
+
+
+class RightStripSlashes(StripSlashes):
+    """
+    SQL equivalent of str.rstrip('/').
+    """
+    function = 'RTRIM'
+
+
+def filepath_expression(prefix=''):
+    """
+    SQL expression for the path of a file instance, matching the
+    get_filepath methods of each storage type. Prefix is the lookup path
+    from the queried model to the file instance, if any.
+    """
+    filename = StripSlashes(prefix + 'file_resource__filename')
+    storage = prefix + 'storage__'
+
+    return Case(
+        When(
+            **{storage + 'serverstorage__isnull': False},
+            then=Concat(
+                RightStripSlashes(storage + 'serverstorage__storage_directory'),
+                Value('/'),
+                filename,
+                output_field=models.CharField())),
+        When(
+            **{storage + 'azureblobstorage__isnull': False},
+            then=Concat(
+                storage + 'azureblobstorage__storage_account',
+                Value('/'),
+                storage + 'azureblobstorage__storage_container',
+                Value('/'),
+                filename,
+                output_field=models.CharField())),
+        When(
+            **{storage + 'awss3storage__isnull': False},
+            then=Concat(
+                storage + 'awss3storage__bucket',
+                Value('/'),
+                filename,
+                output_field=models.CharField())),
+        output_field=models.CharField(),
+    )
+
+
+class FileInstanceQuerySet(models.QuerySet):
+    def annotate_filepath(self, name='filepath'):
+        """
+        Annotate the full path of each file instance, computed in the database.
+        """
+        return self.annotate(**{name: filepath_expression()})
+
+    def filter_datasets(self, sequencedataset=None, resultsdataset=None, tag=None, analysis=None):
+        """
+        Restrict to file instances of a sequence dataset, results dataset,
+        tag or analysis, given by id or for tags by name. Each is matched
+        with a semi-join on the dataset file resource tables, so file
+        instances are never duplicated.
+        """
+        sequence_files = SequenceDataset.file_resources.through.objects
+        results_files = ResultsDataset.file_resources.through.objects
+
+        queryset = self
+        if sequencedataset is not None:
+            queryset = queryset.filter(file_resource_id__in=sequence_files.filter(
+                sequencedataset_id=sequencedataset).values('fileresource_id'))
+        if resultsdataset is not None:
+            queryset = queryset.filter(file_resource_id__in=results_files.filter(
+                resultsdataset_id=resultsdataset).values('fileresource_id'))
+        if tag is not None:
+            queryset = queryset.filter(
+                Q(file_resource_id__in=sequence_files.filter(
+                    sequencedataset__tags__name=tag).values('fileresource_id')) |
+                Q(file_resource_id__in=results_files.filter(
+                    resultsdataset__tags__name=tag).values('fileresource_id')))
+        if analysis is not None:
+            queryset = queryset.filter(
+                Q(file_resource_id__in=sequence_files.filter(
+                    sequencedataset__analysis_id=analysis).values('fileresource_id')) |
+                Q(file_resource_id__in=results_files.filter(
+                    resultsdataset__analysis_id=analysis).values('fileresource_id')))
+        return queryset
+
+    def missing_from(self, storage_id):
+        """
+        Restrict to file instances whose file resource has no undeleted
+        instance on the given storage, as an anti-join.
+        """
+        on_storage = FileInstance.objects.filter(
+            file_resource_id=OuterRef('file_resource_id'),
+            storage_id=storage_id,
+            is_deleted=False)
+        name = 'on_storage_{}'.format(storage_id)
+        return self.annotate(**{name: Exists(on_storage)}).filter(**{name: False})
+
+
 class FileInstance(models.Model):
     """
     Instance of a file in storage.
     """
 
+    objects = FileInstanceQuerySet.as_manager()
+
     history = HistoricalRecords()
 
     owner = models.ForeignKey(
@@ -914,7 +1431,7 @@ class FileInstance(models.Model):
         return str(self.file_resource) + '-' +  self.storage.name
 
     def get_filepath(self):
-        return self.storage.get_filepath(self.file_resource)
+        return get_storage(self.storage_id).get_filepath(self.file_resource)
 
     class Meta:
         unique_together = ('file_resource', 'storage')
@@ -1114,3 +1631,241 @@ class CurationDataset(models.Model):
         )
     def __str__(self):
         return self.curation_instance.name
+
+
+SEARCH_DOCUMENT_FIELDS = OrderedDict([
+    (Patient, search_fields.PATIENT),
+    (Sample, search_fields.SAMPLE),
+    (SequenceDataset, search_fields.SEQUENCE_DATASET),
+    (Submission, search_fields.SUBMISSION),
+    (ResultsDataset, search_fields.RESULT_DATASET),
+    (Analysis, search_fields.ANALYSIS),
+    (Tag, search_fields.TAG),
+])
+
+
+class SearchDocument(models.Model):
+    """
+    Text of an object for the global search, read from the fields listed
+    for its model in SEARCH_DOCUMENT_FIELDS, with its search vector.
+    Kept up to date by signals from every model the text is read from.
+    """
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+    )
+
+    object_id = models.PositiveIntegerField()
+
+    content_object = GenericForeignKey('content_type', 'object_id')
+
+    document = models.TextField()
+
+    search_vector = SearchVectorField(
+        null=True,
+    )
+
+    class Meta:
+        unique_together = ('content_type', 'object_id')
+        indexes = [
+            GinIndex(fields=['search_vector'], name='tantalus_searchdoc_vector_idx'),
+            GinIndex(fields=['document'], opclasses=['gin_trgm_ops'], name='tantalus_searchdoc_trgm'),
+        ]
+
+    @classmethod
+    def matching(cls, model, query, extra_match=None):
+        """
+        Return the documents of a searched model which match a query as
+        text search terms or as a substring, or the extra Q if given.
+        """
+        match = Q(search_vector=SearchQuery(query)) | Q(document__trigram_icontains=query)
+        if extra_match is not None:
+            match |= extra_match
+        return (
+            cls.objects
+            .filter(content_type=ContentType.objects.get_for_model(model))
+            .filter(match))
+
+
+def get_search_dependencies():
+    """
+    Walk the search document field paths, returning for each model read:
+    the (searched model, lookup from it to the model) pairs to find
+    the documents reading it, and the names of its fields read. Also
+    returns, for each many to many through model traversed, (searched
+    model, lookup to the near side, near side model) triples.
+    """
+    dependencies = defaultdict(set)
+    fields_read = defaultdict(set)
+    through_dependencies = defaultdict(set)
+
+    for searched_model, paths in SEARCH_DOCUMENT_FIELDS.items():
+        for path in paths:
+            model = searched_model
+            parts = path.split(LOOKUP_SEP)
+            for i, part in enumerate(parts):
+                field = model._meta.get_field(part)
+                lookup = LOOKUP_SEP.join(parts[:i])
+                dependencies[model].add((searched_model, lookup))
+                fields_read[model].add(field.name)
+                if field.many_to_many:
+                    through = field.remote_field.through if field.concrete else field.through
+                    through_dependencies[through].add((searched_model, lookup, model))
+                if not field.is_relation or i == len(parts) - 1:
+                    break
+                model = field.related_model
+
+    return dependencies, fields_read, through_dependencies
+
+
+SEARCH_DEPENDENCIES, SEARCH_FIELDS_READ, SEARCH_THROUGH_DEPENDENCIES = get_search_dependencies()
+
+
+def add_search_dependents(dependents, searched_model, lookup, pks):
+    """Add the primary keys of objects of a searched model related to pks by a lookup."""
+    pks = list(pks)
+    if not pks:
+        return
+    if not lookup:
+        dependents[searched_model].update(pks)
+    else:
+        dependents[searched_model].update(
+            searched_model.objects
+            .filter(**{lookup + '__in': pks})
+            .values_list('pk', flat=True))
+
+
+def get_search_dependents(model, pks):
+    """Primary keys of the searched objects whose documents read objects, by model."""
+    dependents = defaultdict(set)
+    for searched_model, lookup in SEARCH_DEPENDENCIES[model]:
+        add_search_dependents(dependents, searched_model, lookup, pks)
+    return dependents
+
+
+def refresh_search_documents(dependents):
+    """
+    Rebuild the search documents of searched objects given as primary
+    keys by model, removing those of objects which no longer exist.
+    """
+    for model, pks in dependents.items():
+        pks = list(pks)
+        if not pks:
+            continue
+        content_type = ContentType.objects.get_for_model(model)
+
+        texts = OrderedDict(
+            (pk, OrderedDict())
+            for pk in model.objects.filter(pk__any=pks).values_list('pk', flat=True))
+        for path in SEARCH_DOCUMENT_FIELDS[model]:
+            for pk, value in model.objects.filter(pk__any=list(texts)).values_list('pk', path):
+                if value is not None and value != '':
+                    texts[pk][str(value)] = None
+
+        SearchDocument.objects.filter(content_type=content_type, object_id__any=pks).delete()
+        SearchDocument.objects.bulk_create(
+            [
+                SearchDocument(content_type=content_type, object_id=pk, document=' '.join(values))
+                for pk, values in texts.items()
+            ],
+            ignore_conflicts=True,
+        )
+        (SearchDocument.objects
+            .filter(content_type=content_type, object_id__any=list(texts))
+            .update(search_vector=SearchVector('document')))
+
+    if any(dependents.values()):
+        # After commit, so that no search sees the old generation with the new documents
+        transaction.on_commit(bump_search_generation)
+
+
+SEARCH_GENERATION_KEY = 'search_generation'
+
+
+def get_search_generation():
+    """
+    Return the search generation, which is part of the search cache keys
+    and replaced whenever search documents change, invalidating them all.
+
+    Generations are random and never repeat, so a generation evicted from
+    the cache is replaced by a new one rather than reviving old results.
+    """
+    generation = caches['search'].get(SEARCH_GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        # Another process may have added one first, in which case use theirs
+        caches['search'].add(SEARCH_GENERATION_KEY, generation, timeout=None)
+        generation = caches['search'].get(SEARCH_GENERATION_KEY, generation)
+    return generation
+
+
+def bump_search_generation():
+    # A set rather than an increment, so concurrent bumps cannot cancel out
+    caches['search'].set(SEARCH_GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def reads_search_fields(model, update_fields):
+    return update_fields is None or bool(SEARCH_FIELDS_READ[model].intersection(update_fields))
+
+
+def search_object_changing(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    if not reads_search_fields(sender, update_fields):
+        return
+    # Documents reading the object through relations it is about to leave
+    instance._search_dependents = get_search_dependents(sender, [instance.pk])
+
+
+def search_object_saved(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if not reads_search_fields(sender, update_fields):
+        return
+    dependents = get_search_dependents(sender, [instance.pk])
+    for model, pks in instance.__dict__.pop('_search_dependents', {}).items():
+        dependents[model].update(pks)
+    refresh_search_documents(dependents)
+
+
+def search_object_deleted(sender, instance, **kwargs):
+    refresh_search_documents(instance.__dict__.pop('_search_dependents', {}))
+
+
+def search_relation_changed(sender, instance, action, model, pk_set, **kwargs):
+    if action == 'pre_clear':
+        source = next(
+            field for field in sender._meta.fields
+            if field.is_relation and field.related_model is type(instance))
+        target = next(
+            field for field in sender._meta.fields
+            if field.is_relation and field.related_model is model and field is not source)
+        instance._search_cleared_pks = set(
+            sender.objects.filter(**{source.name: instance.pk}).values_list(target.attname, flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_search_cleared_pks', set())
+
+    dependents = defaultdict(set)
+    for searched_model, lookup, side_model in SEARCH_THROUGH_DEPENDENCIES[sender]:
+        if side_model is type(instance):
+            add_search_dependents(dependents, searched_model, lookup, [instance.pk])
+        elif side_model is model:
+            add_search_dependents(dependents, searched_model, lookup, pk_set)
+    refresh_search_documents(dependents)
+
+
+# Connected per sender rather than for all models, as delete receivers on
+# a model stop its queryset deletes from being done as a single DELETE
+for search_dependency in SEARCH_DEPENDENCIES:
+    signals.pre_save.connect(search_object_changing, sender=search_dependency)
+    signals.pre_delete.connect(search_object_changing, sender=search_dependency)
+    signals.post_save.connect(search_object_saved, sender=search_dependency)
+    signals.post_delete.connect(search_object_deleted, sender=search_dependency)
+
+for search_through_dependency in SEARCH_THROUGH_DEPENDENCIES:
+    signals.m2m_changed.connect(search_relation_changed, sender=search_through_dependency)
@@ -8,6 +8,7 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 """
 import datetime
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -178,6 +179,25 @@ X_FRAME_OPTIONS = "DENY"
 LOGIN_URL = '/account/login'
 JIRA_URL = 'https://www.bcgsc.ca/jira/'
 
+# Global search categories are searched concurrently, with threads for this
+# many searches at once, and categories not done this many seconds after a
+# search starts are given up on
+SEARCH_CONCURRENT_SEARCHES = int(os.environ.get('TANTALUS_SEARCH_CONCURRENT_SEARCHES', '4'))
+SEARCH_TIMEOUT = float(os.environ.get('TANTALUS_SEARCH_TIMEOUT', '5'))
+
+# Global search results are cached in the search cache, on disk so that all
+# processes on a host share them and the generation invalidating them
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': os.environ.get('TANTALUS_SEARCH_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('TANTALUS_SEARCH_CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'tantalus_search_cache')),
+        'TIMEOUT': int(os.environ.get('TANTALUS_SEARCH_CACHE_TIMEOUT', '3600')),
+    },
+}
+
 
 JWT_AUTH = {
     'JWT_VERIFY': True,
@@ -0,0 +1,74 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import User
+from tantalus.api.views import ApproximateCountPaginator
+from tantalus.models import FileResource
+
+
+class ApproximateCountPaginationTests(TestCase):
+    """Page number pagination which estimates the count of large querysets."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='user', password='password'))
+
+        self.file_resources = [
+            FileResource.objects.create(filename='file_{}.bam'.format(i), size=1, created=timezone.now())
+            for i in range(5)
+        ]
+        self.url = reverse('api:fileresource-list')
+
+    def get(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, params)
+        return response.data
+
+    def get_ids(self, data):
+        return [result['id'] for result in data['results']]
+
+    def test_small_table_counted_exactly(self):
+        data = self.get({'page_size': 2})
+        self.assertEqual(data['count'], 5)
+        self.assertFalse(data['count_is_estimate'])
+
+        data = self.get({'page_size': 2, 'filename__startswith': 'file_1'})
+        self.assertEqual(data['count'], 1)
+        self.assertFalse(data['count_is_estimate'])
+
+    @mock.patch.object(ApproximateCountPaginator, 'exact_count_threshold', 0)
+    def test_estimated_count(self):
+        for params in ({'page_size': 2}, {'page_size': 2, 'filename__startswith': 'file_'}):
+            data = self.get(params)
+            self.assertTrue(data['count_is_estimate'], params)
+            self.assertIsInstance(data['count'], int)
+
+        data = self.get({'page_size': 2, 'exact_count': 1})
+        self.assertEqual(data['count'], 5)
+        self.assertFalse(data['count_is_estimate'])
+
+    @mock.patch.object(ApproximateCountPaginator, 'exact_count_threshold', 0)
+    def test_pages_without_exact_count(self):
+        # Paging must not depend on the estimate, which may be anything
+        with mock.patch.object(ApproximateCountPaginator, 'estimate_count', return_value=1):
+            pages = [self.get({'page_size': 2, 'page': page}) for page in (1, 2, 3)]
+            self.assertEqual(self.client.get(self.url, {'page_size': 2, 'page': 4}).status_code, 404)
+
+        self.assertEqual(
+            [self.get_ids(data) for data in pages],
+            [[fr.pk for fr in self.file_resources[i:i + 2]] for i in (0, 2, 4)])
+        self.assertEqual([data['next'] is not None for data in pages], [True, True, False])
+        self.assertEqual([data['previous'] is not None for data in pages], [False, True, True])
+
+    def test_exact_page_boundary(self):
+        data = self.get({'page_size': 5})
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNone(data['next'])
+
+    def test_cursor_pagination_has_no_count(self):
+        data = self.get({'cursor': '', 'page_size': 2})
+        self.assertNotIn('count', data)
+        self.assertNotIn('count_is_estimate', data)
+        self.assertEqual(self.get_ids(data), [fr.pk for fr in self.file_resources[:2]])
@@ -0,0 +1,122 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import User
+from tantalus.models import (
+    FileInstance,
+    FileResource,
+    SequenceFileInfo,
+    ServerStorage,
+)
+
+
+class BulkFileResourceTests(TestCase):
+    """Registering file resources with their file instances in one request."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_login(self.user)
+
+        self.storage = ServerStorage.objects.create(
+            name='server', server_ip='127.0.0.1', storage_directory='/data', username='user')
+        self.other_storage = ServerStorage.objects.create(
+            name='other_server', server_ip='127.0.0.1', storage_directory='/other', username='user')
+
+        self.url = reverse('api:fileresource-bulk')
+
+    def post(self, data):
+        return self.client.post(self.url, data, content_type='application/json')
+
+    def get_item(self, filename, storages=('server',), sequencefileinfo=None):
+        return {
+            'filename': filename,
+            'size': 1,
+            'created': '2019-01-01T00:00:00Z',
+            'file_instances': [{'storage': storage} for storage in storages],
+            'sequencefileinfo': sequencefileinfo,
+        }
+
+    def test_create(self):
+        response = self.post([
+            self.get_item('a.bam', storages=('server', 'other_server')),
+            self.get_item('b.fastq.gz', sequencefileinfo={'read_end': 1, 'genome_region': None, 'index_sequence': 'A-C'}),
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['filename'] for result in response.data], ['a.bam', 'b.fastq.gz'])
+        self.assertTrue(all(result['created'] for result in response.data))
+
+        a = FileResource.objects.get(filename='a.bam')
+        self.assertEqual(response.data[0]['id'], a.pk)
+        self.assertEqual(
+            set(a.fileinstance_set.values_list('storage__name', flat=True)), {'server', 'other_server'})
+        self.assertEqual(
+            {result['id'] for result in response.data[0]['file_instances']},
+            set(a.fileinstance_set.values_list('pk', flat=True)))
+        self.assertEqual(a.history.count(), 1)
+
+        b = FileResource.objects.get(filename='b.fastq.gz')
+        self.assertEqual(response.data[1]['sequencefileinfo'], b.sequencefileinfo.pk)
+        self.assertTrue(response.data[1]['sequencefileinfo_created'])
+        self.assertEqual(b.sequencefileinfo.index_sequence, 'A-C')
+
+    def test_reuse_existing(self):
+        existing = FileResource.objects.create(filename='a.bam', size=1, created=timezone.now())
+        file_instance = FileInstance.objects.create(file_resource=existing, storage=self.storage)
+
+        response = self.post([self.get_item('a.bam', storages=('server', 'other_server')), self.get_item('b.bam')])
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(response.data[0]['id'], existing.pk)
+        self.assertFalse(response.data[0]['created'])
+        self.assertEqual(
+            [(result['id'], result['created']) for result in response.data[0]['file_instances'][:1]],
+            [(file_instance.pk, False)])
+        self.assertTrue(response.data[0]['file_instances'][1]['created'])
+        self.assertTrue(response.data[1]['created'])
+        self.assertEqual(FileResource.objects.filter(filename='a.bam').count(), 1)
+
+    def test_repeated_request(self):
+        data = [self.get_item('a.bam', sequencefileinfo={'read_end': 1, 'genome_region': None, 'index_sequence': None})]
+        first = self.post(data)
+        second = self.post(data)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data[0]['id'], first.data[0]['id'])
+        self.assertFalse(second.data[0]['created'])
+        self.assertFalse(second.data[0]['file_instances'][0]['created'])
+        self.assertFalse(second.data[0]['sequencefileinfo_created'])
+        self.assertEqual(FileInstance.objects.count(), 1)
+        self.assertEqual(SequenceFileInfo.objects.count(), 1)
+
+    def test_invalid_requests(self):
+        for data in (
+                [self.get_item('a.bam'), self.get_item('a.bam')],
+                [self.get_item('a.bam', storages=('missing',))]):
+            response = self.post(data)
+            self.assertEqual(response.status_code, 400, data)
+        self.assertFalse(FileResource.objects.exists())
+
+    def test_created_concurrently(self):
+        existing = FileResource.objects.create(filename='a.bam', size=1, created=timezone.now())
+        in_bulk = FileResource.objects.in_bulk
+        checks = []
+
+        def check_before_concurrent_commit(*args, **kwargs):
+            # The first existence check runs before another request commits a.bam
+            checks.append(args)
+            if len(checks) == 1:
+                return {}
+            return in_bulk(*args, **kwargs)
+
+        with mock.patch.object(FileResource.objects, 'in_bulk', check_before_concurrent_commit):
+            response = self.post([self.get_item('a.bam'), self.get_item('b.bam')])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(checks), 2)
+        self.assertEqual(response.data[0]['id'], existing.pk)
+        self.assertFalse(response.data[0]['created'])
+        self.assertTrue(response.data[0]['file_instances'][0]['created'])
+        self.assertTrue(response.data[1]['created'])
+        self.assertEqual(FileResource.objects.count(), 2)
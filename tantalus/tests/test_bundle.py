@@ -0,0 +1,135 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from account.models import User
+from tantalus.models import (
+    DNALibrary,
+    FileResource,
+    LibraryType,
+    Sample,
+    SequenceDataset,
+    SequencingLane,
+    ServerStorage,
+    Tag,
+)
+
+
+class SequenceDatasetBundleTests(TestCase):
+    """Registering a sequence dataset with its lanes, files and tags in one request."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_login(self.user)
+
+        library_type = LibraryType.objects.create(name='WGS', description='Whole genome')
+        self.library = DNALibrary.objects.create(
+            library_id='A90652A', library_type=library_type, index_format=DNALibrary.SINGLE_INDEX)
+        Sample.objects.create(sample_id='SA123')
+        ServerStorage.objects.create(
+            name='server', server_ip='127.0.0.1', storage_directory='/data', username='user')
+
+        self.url = reverse('api:sequencedataset-bundle')
+
+    def get_lane(self, lane_number='1'):
+        lane = {
+            'flowcell_id': 'FC001',
+            'sequencing_centre': SequencingLane.GSC,
+            'read_type': SequencingLane.PAIRED,
+        }
+        if lane_number is not None:
+            lane['lane_number'] = lane_number
+        return lane
+
+    def get_bundle(self, **kwargs):
+        bundle = {
+            'name': 'dataset',
+            'version_number': 1,
+            'dataset_type': 'BAM',
+            'sample': 'SA123',
+            'library': 'A90652A',
+            'sequence_lanes': [self.get_lane('1'), self.get_lane('2')],
+            'file_resources': [{
+                'filename': 'dataset.bam',
+                'size': 1,
+                'created': '2019-01-01T00:00:00Z',
+                'file_instances': [{'storage': 'server'}],
+                'sequencefileinfo': None,
+            }],
+            'tags': ['tag'],
+        }
+        bundle.update(kwargs)
+        return bundle
+
+    def post(self, data):
+        return self.client.post(self.url, data, content_type='application/json')
+
+    def test_create(self):
+        response = self.post(self.get_bundle())
+        self.assertEqual(response.status_code, 201)
+
+        dataset = SequenceDataset.objects.get(pk=response.data['id'])
+        self.assertEqual(dataset.owner, self.user)
+        self.assertEqual(
+            sorted(dataset.sequence_lanes.values_list('lane_number', flat=True)), ['1', '2'])
+        self.assertEqual(list(dataset.file_resources.values_list('filename', flat=True)), ['dataset.bam'])
+        self.assertEqual(
+            list(dataset.file_resources.get().fileinstance_set.values_list('storage__name', flat=True)), ['server'])
+        self.assertEqual(list(dataset.tags.values_list('name', flat=True)), ['tag'])
+        self.assertEqual((dataset.num_sequence_lanes, dataset.num_total_sequence_lanes), (2, 2))
+        self.assertTrue(dataset.is_complete)
+
+    def test_retry_returns_existing(self):
+        first = self.post(self.get_bundle())
+        second = self.post(self.get_bundle())
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(SequenceDataset.objects.count(), 1)
+        self.assertEqual(SequencingLane.objects.count(), 2)
+        self.assertEqual(FileResource.objects.count(), 1)
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_existing_lanes_reused(self):
+        lane = SequencingLane.objects.create(dna_library=self.library, **self.get_lane('1'))
+        other_dataset = SequenceDataset.objects.create(
+            name='other_dataset', sample=Sample.objects.get(), library=self.library)
+        other_dataset.sequence_lanes.add(lane)
+
+        response = self.post(self.get_bundle())
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(lane.pk, response.data['sequence_lanes'])
+        self.assertEqual(SequencingLane.objects.count(), 2)
+
+        # The other dataset of the library has one more lane in total
+        other_dataset.refresh_from_db()
+        self.assertEqual((other_dataset.num_sequence_lanes, other_dataset.num_total_sequence_lanes), (1, 2))
+        self.assertFalse(other_dataset.is_complete)
+
+    def test_lane_without_lane_number(self):
+        response = self.post(self.get_bundle(sequence_lanes=[self.get_lane(None)]))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(SequencingLane.objects.get().lane_number, '')
+
+        response = self.post(self.get_bundle(name='other_dataset', sequence_lanes=[self.get_lane(None)]))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(SequencingLane.objects.count(), 1)
+
+    def test_invalid_bundles(self):
+        for data in (
+                [self.get_bundle()],
+                'bundle',
+                self.get_bundle(sample='SA999'),
+                self.get_bundle(sequence_lanes=[]),
+                self.get_bundle(tags='tag'),
+                self.get_bundle(allocate_version=True)):
+            response = self.post(data)
+            self.assertEqual(response.status_code, 400, data)
+        self.assertFalse(SequenceDataset.objects.exists())
+        self.assertFalse(SequencingLane.objects.exists())
+
+    def test_invalid_files_create_nothing(self):
+        bundle = self.get_bundle()
+        bundle['file_resources'][0]['file_instances'] = [{'storage': 'missing'}]
+        response = self.post(bundle)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SequencingLane.objects.exists())
+        self.assertFalse(Tag.objects.exists())
@@ -0,0 +1,84 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import User
+from tantalus.models import (
+    DNALibrary,
+    FileResource,
+    LibraryType,
+    Project,
+    ResultsDataset,
+    Sample,
+    SequenceDataset,
+    SequencingLane,
+    Tag,
+)
+
+
+class EagerLoadingTests(TestCase):
+    """Queries run for a page of datasets, whatever the number of rows."""
+
+    num_datasets = 20
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='user', password='password'))
+
+        library_type = LibraryType.objects.create(name='WGS', description='Whole genome')
+        projects = [Project.objects.create(name='project_{}'.format(i)) for i in range(2)]
+        tag = Tag.objects.create(name='tag')
+
+        for i in range(self.num_datasets):
+            sample = Sample.objects.create(sample_id='SA{:03d}'.format(i))
+            sample.projects.add(*projects)
+            library = DNALibrary.objects.create(
+                library_id='A{:05d}'.format(i), library_type=library_type, index_format=DNALibrary.SINGLE_INDEX)
+            lane = SequencingLane.objects.create(
+                flowcell_id='FC{:03d}'.format(i),
+                lane_number='1',
+                dna_library=library,
+                sequencing_centre=SequencingLane.GSC,
+                read_type=SequencingLane.PAIRED,
+            )
+            file_resource = FileResource.objects.create(
+                filename='dataset_{}.bam'.format(i), size=1, created=timezone.now())
+
+            dataset = SequenceDataset.objects.create(
+                name='dataset_{}'.format(i), sample=sample, library=library)
+            dataset.sequence_lanes.add(lane)
+            dataset.tags.add(tag)
+            dataset.file_resources.add(file_resource)
+
+            results = ResultsDataset.objects.create(name='results_{}'.format(i), results_type='align')
+            results.samples.add(sample, Sample.objects.create(sample_id='SB{:03d}'.format(i)))
+            results.libraries.add(library)
+            results.tags.add(tag)
+            results.file_resources.add(file_resource)
+
+    def assertQueriesPerPageConstant(self, url_name):
+        url = reverse(url_name)
+
+        with CaptureQueriesContext(connection) as single_row:
+            response = self.client.get(url, {'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+        with self.assertNumQueries(len(single_row)):
+            response = self.client.get(url, {'page_size': self.num_datasets})
+        self.assertEqual(len(response.data['results']), self.num_datasets)
+        return response
+
+    def test_sequence_dataset_page(self):
+        response = self.assertQueriesPerPageConstant('api:sequencedataset-list')
+        for dataset in response.data['results']:
+            self.assertEqual(len(dataset['sample']['projects']), 2)
+            self.assertEqual(len(dataset['sequence_lanes']), 1)
+
+    def test_results_dataset_page(self):
+        response = self.assertQueriesPerPageConstant('api:resultsdataset-list')
+        for results in response.data['results']:
+            self.assertEqual(len(results['samples']), 2)
+            for sample in results['samples']:
+                self.assertEqual(len(sample['projects']), 2)
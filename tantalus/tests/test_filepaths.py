@@ -0,0 +1,57 @@
+from django.test import TestCase
+from django.utils import timezone
+
+from tantalus.models import (
+    AwsS3Storage,
+    AzureBlobStorage,
+    FileInstance,
+    FileResource,
+    ServerStorage,
+)
+
+
+class FilepathExpressionTests(TestCase):
+    """File instance paths computed in SQL against Storage.get_filepath."""
+
+    filenames = (
+        'sample/lane_1.fastq.gz',
+        '/leading/slash.bam',
+        'trailing/slash/',
+        'plain.bam',
+    )
+
+    def setUp(self):
+        self.storages = [
+            ServerStorage.objects.create(
+                name='server', server_ip='127.0.0.1', storage_directory='/data/storage', username='user'),
+            ServerStorage.objects.create(
+                name='server_trailing_slash', server_ip='127.0.0.1', storage_directory='/data/storage/', username='user'),
+            AzureBlobStorage.objects.create(
+                name='blob', storage_account='account', storage_container='container'),
+            AwsS3Storage.objects.create(
+                name='s3', bucket='bucket'),
+        ]
+
+        for filename in self.filenames:
+            file_resource = FileResource.objects.create(filename=filename, size=1, created=timezone.now())
+            for storage in self.storages:
+                FileInstance.objects.create(file_resource=file_resource, storage=storage)
+
+    def test_annotate_filepath(self):
+        file_instances = FileInstance.objects.annotate_filepath().select_related('file_resource')
+        self.assertEqual(len(file_instances), len(self.filenames) * len(self.storages))
+
+        for file_instance in file_instances:
+            self.assertEqual(
+                file_instance.filepath, file_instance.get_filepath(),
+                '{} on {}'.format(file_instance.file_resource.filename, file_instance.storage_id))
+
+    def test_each_storage_type(self):
+        for storage in self.storages:
+            paths = dict(
+                FileInstance.objects
+                .filter(storage=storage)
+                .annotate_filepath()
+                .values_list('file_resource__filename', 'filepath'))
+            for file_resource in FileResource.objects.all():
+                self.assertEqual(paths[file_resource.filename], storage.get_filepath(file_resource), storage.name)
@@ -0,0 +1,132 @@
+from django.test import TestCase
+
+from tantalus.models import (
+    DNALibrary,
+    LibraryType,
+    Sample,
+    SequenceDataset,
+    SequencingLane,
+)
+
+
+class SequenceLaneCountsTests(TestCase):
+    """Stored lane counts of sequence datasets after each kind of change."""
+
+    def setUp(self):
+        library_type = LibraryType.objects.create(name='WGS', description='Whole genome')
+        self.library = DNALibrary.objects.create(
+            library_id='A00001', library_type=library_type, index_format=DNALibrary.SINGLE_INDEX)
+        self.other_library = DNALibrary.objects.create(
+            library_id='A00002', library_type=library_type, index_format=DNALibrary.SINGLE_INDEX)
+        self.sample = Sample.objects.create(sample_id='SA001')
+
+        self.lanes = [self.create_lane(self.library, str(lane_number)) for lane_number in (1, 2)]
+
+        self.dataset = self.create_dataset('dataset', self.library)
+        self.other_dataset = self.create_dataset('other_dataset', self.library)
+
+    def create_lane(self, library, lane_number, flowcell_id='FC001'):
+        return SequencingLane.objects.create(
+            flowcell_id=flowcell_id,
+            lane_number=lane_number,
+            dna_library=library,
+            sequencing_centre=SequencingLane.GSC,
+            read_type=SequencingLane.PAIRED,
+        )
+
+    def create_dataset(self, name, library):
+        return SequenceDataset.objects.create(name=name, sample=self.sample, library=library)
+
+    def assertLaneCountsCurrent(self, *instances):
+        """Check stored counts of all datasets, and of instances in memory, against recomputed ones."""
+        for dataset in SequenceDataset.objects.all():
+            num_lanes = dataset.sequence_lanes.count()
+            num_total_lanes = SequencingLane.objects.filter(dna_library_id=dataset.library_id).count()
+            expected = (num_lanes, num_total_lanes, num_lanes == num_total_lanes)
+            self.assertEqual(
+                (dataset.num_sequence_lanes, dataset.num_total_sequence_lanes, dataset.is_complete),
+                expected, dataset.name)
+
+        for instance in instances:
+            stored = SequenceDataset.objects.get(pk=instance.pk)
+            self.assertEqual(
+                (instance.num_sequence_lanes, instance.num_total_sequence_lanes, instance.is_complete),
+                (stored.num_sequence_lanes, stored.num_total_sequence_lanes, stored.is_complete),
+                instance.name)
+
+    def test_dataset_created(self):
+        self.assertEqual(self.dataset.num_total_sequence_lanes, 2)
+        self.assertFalse(self.dataset.is_complete)
+        self.assertLaneCountsCurrent(self.dataset)
+
+    def test_dataset_library_changed(self):
+        self.dataset.sequence_lanes.add(*self.lanes)
+        self.dataset.library = self.other_library
+        self.dataset.save()
+        self.assertLaneCountsCurrent(self.dataset)
+
+    def test_forward_add(self):
+        self.dataset.sequence_lanes.add(self.lanes[0])
+        self.assertLaneCountsCurrent(self.dataset)
+        self.assertFalse(self.dataset.is_complete)
+
+        self.dataset.sequence_lanes.add(self.lanes[1])
+        self.assertLaneCountsCurrent(self.dataset)
+        self.assertTrue(self.dataset.is_complete)
+
+    def test_forward_remove(self):
+        self.dataset.sequence_lanes.add(*self.lanes)
+        self.dataset.sequence_lanes.remove(self.lanes[0])
+        self.assertLaneCountsCurrent(self.dataset)
+
+    def test_forward_clear(self):
+        self.dataset.sequence_lanes.add(*self.lanes)
+        self.dataset.sequence_lanes.clear()
+        self.assertLaneCountsCurrent(self.dataset)
+
+    def test_forward_set(self):
+        self.dataset.sequence_lanes.set(self.lanes)
+        self.dataset.sequence_lanes.set(self.lanes[:1])
+        self.assertLaneCountsCurrent(self.dataset)
+
+    def test_reverse_add(self):
+        self.lanes[0].sequencedataset_set.add(self.dataset, self.other_dataset)
+        self.assertLaneCountsCurrent()
+
+    def test_reverse_remove(self):
+        self.lanes[0].sequencedataset_set.add(self.dataset, self.other_dataset)
+        self.lanes[0].sequencedataset_set.remove(self.dataset)
+        self.assertLaneCountsCurrent()
+
+    def test_reverse_clear(self):
+        self.dataset.sequence_lanes.add(*self.lanes)
+        self.other_dataset.sequence_lanes.add(*self.lanes)
+        self.lanes[0].sequencedataset_set.clear()
+        self.assertLaneCountsCurrent()
+
+    def test_lane_created(self):
+        self.dataset.sequence_lanes.add(*self.lanes)
+        self.create_lane(self.library, '3')
+        self.assertLaneCountsCurrent()
+
+    def test_lane_moved_to_other_library(self):
+        other_library_dataset = self.create_dataset('other_library_dataset', self.other_library)
+        self.dataset.sequence_lanes.add(*self.lanes)
+
+        lane = self.lanes[0]
+        lane.dna_library = self.other_library
+        lane.save()
+        self.assertLaneCountsCurrent()
+        other_library_dataset.refresh_from_db()
+        self.assertEqual(other_library_dataset.num_total_sequence_lanes, 1)
+
+    def test_lane_deleted(self):
+        self.dataset.sequence_lanes.add(*self.lanes)
+        self.lanes[0].delete()
+        self.assertLaneCountsCurrent()
+        self.assertTrue(SequenceDataset.objects.get(pk=self.dataset.pk).is_complete)
+
+    def test_lanes_deleted_with_queryset(self):
+        self.dataset.sequence_lanes.add(*self.lanes)
+        SequencingLane.objects.filter(pk=self.lanes[0].pk).delete()
+        self.assertLaneCountsCurrent()
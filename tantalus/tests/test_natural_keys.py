@@ -0,0 +1,121 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import User
+from tantalus.models import (
+    DNALibrary,
+    FileResource,
+    LibraryType,
+    ResultsDataset,
+    Sample,
+    SequenceDataset,
+    SequencingLane,
+)
+
+
+class NaturalKeyTests(TestCase):
+    """Dataset relations given by natural key as well as by primary key."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='user', password='password'))
+
+        library_type = LibraryType.objects.create(name='WGS', description='Whole genome')
+        self.libraries = [
+            DNALibrary.objects.create(
+                library_id=library_id, library_type=library_type, index_format=DNALibrary.SINGLE_INDEX)
+            for library_id in ('A90652A', 'A90652B')
+        ]
+        self.samples = [Sample.objects.create(sample_id=sample_id) for sample_id in ('SA123', 'SA124')]
+        self.file_resources = [
+            FileResource.objects.create(filename='file_{}.bam'.format(i), size=1, created=timezone.now())
+            for i in range(3)
+        ]
+        self.lane = SequencingLane.objects.create(
+            dna_library=self.libraries[0], flowcell_id='FC001', lane_number='1',
+            sequencing_centre=SequencingLane.GSC, read_type=SequencingLane.PAIRED)
+
+    def post(self, url_name, data):
+        return self.client.post(reverse(url_name), data, content_type='application/json')
+
+    def post_results(self, **kwargs):
+        data = {'name': 'results', 'results_type': 'align', 'samples': [], 'libraries': [], 'file_resources': []}
+        data.update(kwargs)
+        return self.post('api:resultsdataset-list', data)
+
+    def test_sequence_dataset(self):
+        response = self.post('api:sequencedataset-list', {
+            'name': 'dataset',
+            'sample': 'SA124',
+            'library': 'A90652A',
+            'file_resources': ['file_0.bam', self.file_resources[1].pk],
+            'sequence_lanes': [{'flowcell_id': 'FC001', 'lane_number': '1'}],
+        })
+        self.assertEqual(response.status_code, 201)
+
+        dataset = SequenceDataset.objects.get(pk=response.data['id'])
+        self.assertEqual(dataset.sample, self.samples[1])
+        self.assertEqual(dataset.library, self.libraries[0])
+        self.assertEqual(set(dataset.file_resources.all()), set(self.file_resources[:2]))
+        self.assertEqual(list(dataset.sequence_lanes.all()), [self.lane])
+
+    def test_results_dataset(self):
+        response = self.post_results(
+            samples=['SA123', self.samples[1].pk],
+            libraries=['A90652B'],
+            file_resources=['file_2.bam', 'file_0.bam'])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(response.data['samples']), {sample.pk for sample in self.samples})
+        self.assertEqual(response.data['libraries'], [self.libraries[1].pk])
+        self.assertEqual(set(response.data['file_resources']), {self.file_resources[2].pk, self.file_resources[0].pk})
+
+    def test_missing_keys_reported_together(self):
+        response = self.post_results(samples=['SA123', 'SA999', 'SA998'])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('SA999, SA998', str(response.data['samples']))
+        self.assertFalse(ResultsDataset.objects.exists())
+
+    def test_digit_strings(self):
+        # A digit string which is only a primary key
+        response = self.post_results(samples=[str(self.samples[0].pk)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['samples'], [self.samples[0].pk])
+
+        # A digit string which is the natural key and the primary key of one sample
+        numeric = Sample.objects.create(sample_id='0')
+        numeric.sample_id = str(numeric.pk)
+        numeric.save()
+        response = self.post_results(name='numeric', samples=[numeric.sample_id])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['samples'], [numeric.pk])
+
+    def test_ambiguous_digit_string(self):
+        Sample.objects.create(sample_id=str(self.samples[0].pk))
+        response = self.post_results(samples=[str(self.samples[0].pk)])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('both a primary key and a natural key', str(response.data['samples']))
+
+        # An integer is always a primary key
+        response = self.post_results(samples=[self.samples[0].pk])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['samples'], [self.samples[0].pk])
+
+    def test_ambiguous_lane(self):
+        SequencingLane.objects.create(
+            dna_library=self.libraries[1], flowcell_id='FC001', lane_number='1',
+            sequencing_centre=SequencingLane.GSC, read_type=SequencingLane.PAIRED)
+        data = {
+            'name': 'dataset',
+            'sample': 'SA123',
+            'library': 'A90652A',
+            'file_resources': ['file_0.bam'],
+            'sequence_lanes': [{'flowcell_id': 'FC001', 'lane_number': '1'}],
+        }
+        response = self.post('api:sequencedataset-list', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('library_id is required', str(response.data['sequence_lanes']))
+
+        data['sequence_lanes'][0]['library_id'] = 'A90652A'
+        response = self.post('api:sequencedataset-list', data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sequence_lanes'], [self.lane.pk])
@@ -0,0 +1,47 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from account.models import User
+from tantalus.models import Sample
+
+
+class CursorPaginationTests(TestCase):
+    """Keyset pagination, opted in to by passing a cursor parameter."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='user', password='password'))
+
+        self.samples = [Sample.objects.create(sample_id='SA{}'.format(i)) for i in range(25)]
+        self.url = reverse('api:sample-list')
+
+    def get_all_pages(self, params):
+        pages = []
+        response = self.client.get(self.url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            if response.data['next'] is None:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_pages_in_id_order(self):
+        pages = self.get_all_pages({'cursor': '', 'page_size': 10})
+        self.assertEqual([len(page['results']) for page in pages], [10, 10, 5])
+        self.assertNotIn('count', pages[0])
+        self.assertIsNone(pages[0]['previous'])
+
+        ids = [result['id'] for page in pages for result in page['results']]
+        self.assertEqual(ids, [sample.pk for sample in self.samples])
+
+    def test_filtered(self):
+        pages = self.get_all_pages({'cursor': '', 'page_size': 2, 'sample_id__in': 'SA1,SA3,SA5'})
+        ids = [result['id'] for page in pages for result in page['results']]
+        self.assertEqual(ids, [self.samples[i].pk for i in (1, 3, 5)])
+
+    def test_page_number_pagination_by_default(self):
+        response = self.client.get(self.url, {'page_size': 10, 'page': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(
+            [result['id'] for result in response.data['results']],
+            [sample.pk for sample in self.samples[20:]])
@@ -0,0 +1,79 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import User
+from tantalus.models import (
+    FileInstance,
+    FileResource,
+    Sample,
+    ServerStorage,
+)
+
+
+class QueryRouteTests(TestCase):
+    """Filters given in a JSON request body rather than the query string."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='user', password='password'))
+
+        self.samples = [Sample.objects.create(sample_id=sample_id) for sample_id in ('SA1', 'SA,2', 'SA3')]
+
+        storage = ServerStorage.objects.create(
+            name='server', server_ip='127.0.0.1', storage_directory='/data', username='user')
+        self.file_instances = []
+        for i in range(5):
+            file_resource = FileResource.objects.create(
+                filename='file_{}.bam'.format(i), size=1, created=timezone.now())
+            self.file_instances.append(FileInstance.objects.create(file_resource=file_resource, storage=storage))
+
+    def query(self, url_name, data, params=''):
+        return self.client.post(
+            reverse(url_name) + params, data, content_type='application/json')
+
+    def get_ids(self, response):
+        return sorted(result['id'] for result in response.data['results'])
+
+    def test_in_filter_list(self):
+        file_resource_ids = [file_instance.file_resource_id for file_instance in self.file_instances[:3]]
+        response = self.query('api:fileinstance-query', {
+            'file_resource__in': file_resource_ids,
+            'storage__name': 'server',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_ids(response), sorted(fi.pk for fi in self.file_instances[:3]))
+
+    def test_list_values_with_commas(self):
+        response = self.query('api:sample-query', {'sample_id__in': ['SA,2', 'SA3']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_ids(response), [self.samples[1].pk, self.samples[2].pk])
+
+    def test_comma_separated_string(self):
+        response = self.query('api:sample-query', {'sample_id__in': 'SA1,SA3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_ids(response), [self.samples[0].pk, self.samples[2].pk])
+
+    def test_query_string_in_filter(self):
+        response = self.client.get(reverse('api:sample-list'), {'sample_id__in': 'SA1,SA3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_ids(response), [self.samples[0].pk, self.samples[2].pk])
+
+    def test_empty_list(self):
+        response = self.query('api:sample-query', {'sample_id__in': []})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), len(self.samples))
+
+    def test_pagination_in_query_string(self):
+        response = self.query('api:sample-query', {'id__in': [sample.pk for sample in self.samples]}, '?page_size=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_invalid_values(self):
+        for data in (
+                {'sample_id': ['SA1', 'SA3']},
+                {'sample_id__in': {'SA1': True}},
+                {'id__in': ['one']},
+                ['SA1']):
+            response = self.query('api:sample-query', data)
+            self.assertEqual(response.status_code, 400, data)
@@ -0,0 +1,143 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import User
+from tantalus.models import (
+    Curation,
+    CurationDataset,
+    DNALibrary,
+    FileResource,
+    LibraryType,
+    ResultsDataset,
+    Sample,
+    SequenceDataset,
+)
+from tantalus.services import get_curation_change
+
+
+class IncrementalRelationsTests(TestCase):
+    """Adding to and removing from many to many relations through the relations route."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_login(self.user)
+
+        self.file_resources = [
+            FileResource.objects.create(filename='file_{}.bam'.format(i), size=1, created=timezone.now())
+            for i in range(3)
+        ]
+        self.results = ResultsDataset.objects.create(name='results', results_type='align')
+        self.results.file_resources.add(self.file_resources[0])
+
+        self.url = reverse('api:resultsdataset-relations', args=(self.results.pk,))
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type='application/json')
+
+    def assertFileResources(self, indexes):
+        self.assertEqual(
+            set(self.results.file_resources.values_list('pk', flat=True)),
+            {self.file_resources[i].pk for i in indexes})
+
+    def test_add_and_remove(self):
+        response = self.post(self.url, {'file_resources': {
+            'add': [self.file_resources[1].pk, self.file_resources[2].pk],
+            'remove': [self.file_resources[0].pk],
+        }})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['file_resources']['add'], [self.file_resources[1].pk, self.file_resources[2].pk])
+        self.assertEqual(response.data['file_resources']['remove'], [self.file_resources[0].pk])
+        self.assertFileResources([1, 2])
+
+    def test_operation_missing_or_empty(self):
+        response = self.post(self.url, {'file_resources': {'add': [self.file_resources[1].pk]}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['file_resources']['remove'], [])
+        self.assertFileResources([0, 1])
+
+        response = self.post(self.url, {'file_resources': {'add': [], 'remove': [self.file_resources[1].pk]}})
+        self.assertEqual(response.status_code, 200)
+        self.assertFileResources([0])
+
+    def test_add_existing(self):
+        response = self.post(self.url, {'file_resources': {'add': [self.file_resources[0].pk]}})
+        self.assertEqual(response.status_code, 200)
+        self.assertFileResources([0])
+
+    def test_missing_key_changes_nothing(self):
+        missing_pk = max(file_resource.pk for file_resource in self.file_resources) + 1
+        response = self.post(self.url, {'file_resources': {
+            'add': [self.file_resources[1].pk, missing_pk],
+            'remove': [self.file_resources[0].pk],
+        }})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('add', response.data['file_resources'])
+        self.assertFileResources([0])
+
+    def test_invalid_changes(self):
+        for data in (
+                [self.file_resources[1].pk],
+                {'owner': {'add': [self.user.pk]}},
+                {'file_resources': [self.file_resources[1].pk]},
+                {'file_resources': {'replace': [self.file_resources[1].pk]}}):
+            response = self.post(self.url, data)
+            self.assertEqual(response.status_code, 400, data)
+        self.assertFileResources([0])
+
+
+class CurationRelationsTests(TestCase):
+    """Curation dataset changes through the relations route, as seen by the change log."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.force_login(self.user)
+
+        library_type = LibraryType.objects.create(name='WGS', description='Whole genome')
+        library = DNALibrary.objects.create(
+            library_id='A00001', library_type=library_type, index_format=DNALibrary.SINGLE_INDEX)
+        sample = Sample.objects.create(sample_id='SA001')
+        self.datasets = [
+            SequenceDataset.objects.create(name='dataset_{}'.format(i), sample=sample, library=library)
+            for i in range(2)
+        ]
+
+        self.curation = Curation.objects.create(name='curation', owner=self.user)
+        CurationDataset.objects.create(
+            curation_instance=self.curation, sequencedataset_instance=self.datasets[0], version=self.curation.version)
+
+        self.url = reverse('api:curation-relations', args=(self.curation.pk,))
+
+    def post(self, data):
+        return self.client.post(self.url, data, content_type='application/json')
+
+    def test_add_and_remove(self):
+        response = self.post({'sequencedatasets': {'add': [self.datasets[1].pk]}})
+        self.assertEqual(response.status_code, 200)
+        self.curation.refresh_from_db()
+        self.assertEqual(self.curation.version, 'v2.0.0')
+        self.assertEqual(self.curation.user, self.user)
+        self.assertEqual(
+            set(CurationDataset.objects.filter(curation_instance=self.curation).values_list('version', flat=True)),
+            {'v2.0.0'})
+
+        change = get_curation_change(self.curation)[-1]
+        self.assertEqual(change['version'], 'v2.0.0')
+        self.assertIn('{} added'.format(self.datasets[1].pk), change['operation_log'])
+
+        response = self.post({'sequencedatasets': {'remove': [self.datasets[0].pk]}})
+        self.assertEqual(response.status_code, 200)
+        self.curation.refresh_from_db()
+        self.assertEqual(self.curation.version, 'v3.0.0')
+        self.assertEqual(list(self.curation.sequencedatasets.all()), [self.datasets[1]])
+
+        change = get_curation_change(self.curation)[-1]
+        self.assertEqual(change['version'], 'v3.0.0')
+        self.assertIn('{} deleted'.format(self.datasets[0].pk), change['operation_log'])
+
+    def test_no_change_keeps_version(self):
+        response = self.post({'sequencedatasets': {'add': [self.datasets[0].pk]}})
+        self.assertEqual(response.status_code, 200)
+        self.curation.refresh_from_db()
+        self.assertEqual(self.curation.version, 'v1.0.0')
+        self.assertEqual(CurationDataset.history.filter(history_type='-').count(), 0)
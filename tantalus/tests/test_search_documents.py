@@ -0,0 +1,147 @@
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from tantalus.models import (
+    DNALibrary,
+    LibraryType,
+    ResultsDataset,
+    Sample,
+    SearchDocument,
+    SequenceDataset,
+    SequencingLane,
+    SEARCH_DOCUMENT_FIELDS,
+    Tag,
+    refresh_search_documents,
+)
+
+
+class SearchDocumentTests(TestCase):
+    """Search documents maintained by signals against rebuilt ones."""
+
+    def setUp(self):
+        library_type = LibraryType.objects.create(name='WGS', description='Whole genome')
+        self.library = DNALibrary.objects.create(
+            library_id='A00001', library_type=library_type, index_format=DNALibrary.SINGLE_INDEX)
+        self.sample = Sample.objects.create(sample_id='SA001', tissue='liver')
+        self.other_sample = Sample.objects.create(sample_id='SA002')
+        self.lane = SequencingLane.objects.create(
+            flowcell_id='FC001',
+            lane_number='1',
+            dna_library=self.library,
+            sequencing_centre=SequencingLane.GSC,
+            read_type=SequencingLane.PAIRED,
+        )
+        self.dataset = SequenceDataset.objects.create(
+            name='sequence_dataset', sample=self.sample, library=self.library)
+        self.results = ResultsDataset.objects.create(name='results_dataset', results_type='align')
+        self.tag = Tag.objects.create(name='tag_one')
+
+    def get_documents(self):
+        """Stored documents by content type and object id, as sorted words."""
+        return {
+            (document.content_type_id, document.object_id): sorted(document.document.split(' '))
+            for document in SearchDocument.objects.all()
+        }
+
+    def get_document(self, obj):
+        return SearchDocument.objects.get(
+            content_type=ContentType.objects.get_for_model(obj), object_id=obj.pk).document
+
+    def assertDocumentsCurrent(self):
+        """Check that stored documents are those rebuilt from scratch, with none for missing objects."""
+        stored = self.get_documents()
+
+        refresh_search_documents({
+            model: list(model.objects.values_list('pk', flat=True))
+            for model in SEARCH_DOCUMENT_FIELDS
+        })
+        self.assertEqual(stored, self.get_documents())
+
+        for model in SEARCH_DOCUMENT_FIELDS:
+            object_ids = set(
+                SearchDocument.objects
+                .filter(content_type=ContentType.objects.get_for_model(model))
+                .values_list('object_id', flat=True))
+            self.assertEqual(object_ids, set(model.objects.values_list('pk', flat=True)), model.__name__)
+
+    def test_created(self):
+        self.assertIn('SA001', self.get_document(self.sample))
+        self.assertIn('SA001', self.get_document(self.dataset))
+        self.assertDocumentsCurrent()
+
+    def test_matching(self):
+        matching = SearchDocument.matching(Sample, 'SA00').values_list('object_id', flat=True)
+        self.assertEqual(set(matching), {self.sample.pk, self.other_sample.pk})
+
+        matching = SearchDocument.matching(Sample, 'liver').values_list('object_id', flat=True)
+        self.assertEqual(set(matching), {self.sample.pk})
+
+    def test_related_object_saved(self):
+        self.sample.sample_id = 'SA003'
+        self.sample.save()
+        self.assertIn('SA003', self.get_document(self.dataset))
+        self.assertNotIn('SA001', self.get_document(self.dataset))
+        self.assertDocumentsCurrent()
+
+    def test_save_with_unread_update_fields(self):
+        self.sample.is_reference = True
+        self.sample.save(update_fields=['is_reference'])
+        self.assertDocumentsCurrent()
+
+    def test_foreign_key_changed(self):
+        self.dataset.sample = self.other_sample
+        self.dataset.save()
+        self.assertIn('SA002', self.get_document(self.dataset))
+        self.assertDocumentsCurrent()
+
+    def test_forward_add_remove_clear(self):
+        self.results.tags.add(self.tag)
+        self.assertIn('tag_one', self.get_document(self.results))
+        self.assertIn('results_dataset', self.get_document(self.tag))
+        self.assertDocumentsCurrent()
+
+        self.results.tags.remove(self.tag)
+        self.assertNotIn('tag_one', self.get_document(self.results))
+        self.assertDocumentsCurrent()
+
+        self.results.tags.add(self.tag)
+        self.results.tags.clear()
+        self.assertNotIn('tag_one', self.get_document(self.results))
+        self.assertDocumentsCurrent()
+
+    def test_reverse_add_remove_clear(self):
+        self.lane.sequencedataset_set.add(self.dataset)
+        self.assertIn('FC001', self.get_document(self.dataset))
+        self.assertDocumentsCurrent()
+
+        self.lane.sequencedataset_set.remove(self.dataset)
+        self.assertNotIn('FC001', self.get_document(self.dataset))
+        self.assertDocumentsCurrent()
+
+        self.lane.sequencedataset_set.add(self.dataset)
+        self.lane.sequencedataset_set.clear()
+        self.assertNotIn('FC001', self.get_document(self.dataset))
+        self.assertDocumentsCurrent()
+
+    def test_tag_add_and_remove_datasets(self):
+        self.tag.add_datasets(SequenceDataset, [self.dataset.pk])
+        self.assertIn('sequence_dataset', self.get_document(self.tag))
+        self.assertDocumentsCurrent()
+
+        self.tag.remove_datasets(SequenceDataset, [self.dataset.pk])
+        self.assertNotIn('sequence_dataset', self.get_document(self.tag))
+        self.assertDocumentsCurrent()
+
+    def test_related_object_deleted(self):
+        self.results.tags.add(self.tag)
+        self.tag.delete()
+        self.assertNotIn('tag_one', self.get_document(self.results))
+        self.assertDocumentsCurrent()
+
+    def test_object_deleted(self):
+        self.sample.delete()
+        self.assertDocumentsCurrent()
+
+    def test_queryset_deleted(self):
+        Sample.objects.filter(pk=self.other_sample.pk).delete()
+        self.assertDocumentsCurrent()
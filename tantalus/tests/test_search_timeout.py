@@ -0,0 +1,32 @@
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from search_util import search_helper
+
+
+def search_in_worker(category, query, offset, deadline):
+    if category == 'Samples':
+        time.sleep(1)
+    return {'results': [], 'count': 1, 'next_offset': None}
+
+
+@override_settings(SEARCH_TIMEOUT=0.2)
+class SearchTimeoutTests(SimpleTestCase):
+    """Categories not searched within the search timeout."""
+
+    @mock.patch.object(search_helper, 'search_category_in_worker', search_in_worker)
+    def test_slow_category_timed_out(self):
+        start = time.monotonic()
+        results = search_helper.search_categories(['Patients', 'Samples'], 'SA123')
+        self.assertLess(time.monotonic() - start, 0.5)
+
+        self.assertEqual(results['Patients']['count'], 1)
+        self.assertNotIn('timed_out', results['Patients'])
+        self.assertTrue(results['Samples']['timed_out'])
+        self.assertEqual(results['Samples']['results'], [])
+
+    def test_category_started_after_deadline(self):
+        result = search_helper.search_category_in_worker('Samples', 'SA123', 0, time.monotonic())
+        self.assertTrue(result['timed_out'])
@@ -0,0 +1,93 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import User
+from tantalus.models import (
+    DNALibrary,
+    FileInstance,
+    FileResource,
+    LibraryType,
+    ResultsDataset,
+    Sample,
+    SequenceDataset,
+    ServerStorage,
+    Tag,
+)
+
+
+class SemiJoinFilterTests(TestCase):
+    """Filters across to-many relations, which match each row once."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='user', password='password'))
+
+        storage = ServerStorage.objects.create(
+            name='server', server_ip='127.0.0.1', storage_directory='/data', username='user')
+        self.tags = [Tag.objects.create(name='tag_{}'.format(i)) for i in range(2)]
+
+        # Every file resource is on the server, so each dataset has several
+        # rows through file_resources__fileinstance
+        self.file_resources = []
+        for i in range(4):
+            file_resource = FileResource.objects.create(
+                filename='file_{}.bam'.format(i), size=1, created=timezone.now())
+            FileInstance.objects.create(file_resource=file_resource, storage=storage)
+            self.file_resources.append(file_resource)
+
+        self.results = []
+        for i in range(2):
+            results = ResultsDataset.objects.create(name='results_{}'.format(i), results_type='align')
+            results.file_resources.add(*self.file_resources[2 * i:2 * i + 2])
+            self.results.append(results)
+        self.results[0].tags.add(*self.tags)
+        self.results[1].tags.add(self.tags[1])
+
+        library_type = LibraryType.objects.create(name='WGS', description='Whole genome')
+        library = DNALibrary.objects.create(
+            library_id='A00001', library_type=library_type, index_format=DNALibrary.SINGLE_INDEX)
+        sample = Sample.objects.create(sample_id='SA001')
+        self.dataset = SequenceDataset.objects.create(name='dataset', sample=sample, library=library)
+        self.dataset.file_resources.add(*self.file_resources)
+        self.dataset.tags.add(*self.tags)
+
+    def get_ids(self, url_name, params):
+        response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, 200, params)
+        self.assertEqual(response.data['count'], len(response.data['results']))
+        return [result['id'] for result in response.data['results']]
+
+    def test_each_row_once(self):
+        self.assertEqual(
+            self.get_ids('api:resultsdataset-list', {'file_resources__fileinstance__storage__name': 'server'}),
+            [results.pk for results in self.results])
+        self.assertEqual(
+            self.get_ids('api:sequencedataset-list', {'file_resources__fileinstance__storage__name': 'server'}),
+            [self.dataset.pk])
+        self.assertEqual(self.get_ids('api:sequencedataset-list', {'tags__name': 'tag_1'}), [self.dataset.pk])
+
+    def test_filters_match(self):
+        self.assertEqual(self.get_ids('api:resultsdataset-list', {'tags__name': 'tag_0'}), [self.results[0].pk])
+        self.assertEqual(
+            self.get_ids('api:resultsdataset-list', {'file_resources__filename': 'file_3.bam'}),
+            [self.results[1].pk])
+        self.assertEqual(self.get_ids('api:resultsdataset-list', {'tags__name': 'missing'}), [])
+
+    def test_combined_filters(self):
+        self.assertEqual(
+            self.get_ids('api:resultsdataset-list', {'tags__name': 'tag_1', 'file_resources__filename': 'file_0.bam'}),
+            [self.results[0].pk])
+        self.assertEqual(
+            self.get_ids('api:resultsdataset-list', {'tags__name': 'tag_0', 'file_resources__filename': 'file_3.bam'}),
+            [])
+        self.assertEqual(
+            self.get_ids('api:resultsdataset-list', {'tags__name': 'tag_1', 'name': 'results_1'}),
+            [self.results[1].pk])
+
+    def test_reverse_foreign_key(self):
+        self.assertEqual(
+            self.get_ids('api:fileresource-list', {'fileinstance__storage__name': 'server'}),
+            [file_resource.pk for file_resource in self.file_resources])
+        self.assertEqual(
+            self.get_ids('api:fileinstance-list', {'file_resource__sequencedataset__id': self.dataset.pk}),
+            list(FileInstance.objects.order_by('id').values_list('pk', flat=True)))
@@ -0,0 +1,74 @@
+import json
+from unittest import mock
+
+from django.http import StreamingHttpResponse
+from django.test import TestCase
+from django.urls import reverse
+
+from account.models import User
+from tantalus.api.views import StreamingListMixin
+from tantalus.models import (
+    DNALibrary,
+    LibraryType,
+    Sample,
+    SequenceDataset,
+)
+
+
+@mock.patch.object(StreamingListMixin, 'stream_chunk_size', 2)
+class StreamingListTests(TestCase):
+    """Unpaginated lists streamed a chunk of rows at a time."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='user', password='password'))
+
+        library_type = LibraryType.objects.create(name='WGS', description='Whole genome')
+        library = DNALibrary.objects.create(
+            library_id='A00001', library_type=library_type, index_format=DNALibrary.SINGLE_INDEX)
+        self.samples = [Sample.objects.create(sample_id='SA{}'.format(i)) for i in range(5)]
+        for sample in self.samples:
+            SequenceDataset.objects.create(name='dataset_{}'.format(sample.sample_id), sample=sample, library=library)
+
+    def get_streamed(self, url_name, params):
+        response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return response, b''.join(response.streaming_content).decode()
+
+    def get_paginated_results(self, url_name):
+        response = self.client.get(reverse(url_name), {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_json_same_as_paginated(self):
+        for url_name in ('api:sample-list', 'api:sequencedataset-list'):
+            response, content = self.get_streamed(url_name, {'no_pagination': ''})
+            self.assertEqual(response['Content-Type'], 'application/json')
+
+            data = json.loads(content)
+            self.assertEqual(list(data), ['results', 'count'])
+            self.assertEqual(data['count'], 5)
+            self.assertEqual(data['results'], self.get_paginated_results(url_name))
+
+    def test_ndjson(self):
+        response, content = self.get_streamed('api:sample-list', {'no_pagination': '', 'stream': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        lines = content.splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual([json.loads(line) for line in lines], self.get_paginated_results('api:sample-list'))
+
+    def test_filtered(self):
+        _, content = self.get_streamed('api:sample-list', {'no_pagination': '', 'sample_id__in': 'SA1,SA3'})
+        data = json.loads(content)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([result['id'] for result in data['results']], [self.samples[1].pk, self.samples[3].pk])
+
+    def test_empty(self):
+        _, content = self.get_streamed('api:sample-list', {'no_pagination': '', 'sample_id': 'SA999'})
+        self.assertEqual(json.loads(content), {'results': [], 'count': 0})
+
+    def test_browsable_api_not_streamed(self):
+        response = self.client.get(reverse('api:sample-list'), {'no_pagination': '', 'format': 'api'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIsInstance(response, StreamingHttpResponse)
@@ -0,0 +1,96 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import User
+from tantalus.models import (
+    DNALibrary,
+    FileResource,
+    LibraryType,
+    Sample,
+    SequenceDataset,
+    SequencingLane,
+)
+
+
+class DatasetVersionTests(TestCase):
+    """Version numbers allocated on the server, and filtering to the latest versions."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='user', password='password'))
+
+        library_type = LibraryType.objects.create(name='WGS', description='Whole genome')
+        self.library = DNALibrary.objects.create(
+            library_id='A90652A', library_type=library_type, index_format=DNALibrary.SINGLE_INDEX)
+        self.sample = Sample.objects.create(sample_id='SA123')
+        self.file_resource = FileResource.objects.create(filename='dataset.bam', size=1, created=timezone.now())
+        self.lane = SequencingLane.objects.create(
+            dna_library=self.library, flowcell_id='FC001', lane_number='1',
+            sequencing_centre=SequencingLane.GSC, read_type=SequencingLane.PAIRED)
+
+    def create_dataset(self, name, version_number, is_production=False):
+        return SequenceDataset.objects.create(
+            name=name, version_number=version_number, is_production=is_production,
+            sample=self.sample, library=self.library)
+
+    def post(self, **kwargs):
+        data = {
+            'name': 'dataset',
+            'sample': self.sample.pk,
+            'library': self.library.pk,
+            'file_resources': [self.file_resource.pk],
+            'sequence_lanes': [self.lane.pk],
+        }
+        data.update(kwargs)
+        return self.client.post(reverse('api:sequencedataset-list'), data, content_type='application/json')
+
+    def get_ids(self, params):
+        response = self.client.get(reverse('api:sequencedataset-list'), params)
+        self.assertEqual(response.status_code, 200, params)
+        return sorted(result['id'] for result in response.data['results'])
+
+    def test_allocate_version(self):
+        response = self.post(allocate_version=True)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['version_number'], 1)
+        self.assertNotIn('allocate_version', response.data)
+
+        self.create_dataset('dataset', 5)
+        response = self.post(allocate_version=True, version_number=2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['version_number'], 6)
+
+        response = self.post(name='other_dataset', allocate_version=True)
+        self.assertEqual(response.data['version_number'], 1)
+
+    def test_given_version(self):
+        self.create_dataset('dataset', 1)
+        response = self.post(version_number=1)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post(version_number=2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['version_number'], 2)
+
+    def test_allocate_version_ignored_on_update(self):
+        dataset = self.create_dataset('dataset', 3)
+        response = self.client.patch(
+            reverse('api:sequencedataset-detail', args=(dataset.pk,)),
+            {'allocate_version': True, 'note': 'note'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        dataset.refresh_from_db()
+        self.assertEqual((dataset.version_number, dataset.note), (3, 'note'))
+
+    def test_latest_only(self):
+        datasets = [
+            self.create_dataset('dataset', 1, is_production=True),
+            self.create_dataset('dataset', 2),
+            self.create_dataset('other_dataset', 1),
+        ]
+
+        self.assertEqual(self.get_ids({'latest_only': 'true'}), [datasets[1].pk, datasets[2].pk])
+        self.assertEqual(self.get_ids({'latest_only': 'false'}), [dataset.pk for dataset in datasets])
+
+        # The latest among the matching datasets
+        self.assertEqual(self.get_ids({'latest_only': 'true', 'is_production': 'true'}), [datasets[0].pk])
+        self.assertEqual(self.get_ids({'latest_only': 'true', 'name': 'other_dataset'}), [datasets[2].pk])
@@ -28,6 +28,7 @@ urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^api/', include('tantalus.api.urls')),
     url(r'^account/', include('account.urls')),
+    url(r'^search/category/$', tantalus.views.SearchCategoryJSON.as_view(), name='search-category-json'),
     url(r'^search/', tantalus.views.SearchView.as_view(), name='search'),
     url(r'^samples/$', tantalus.views.sample_list, name='sample-list'),
     url(r'^samples/create$', tantalus.views.SampleCreate.as_view(), name='sample-add'),
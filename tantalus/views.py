@@ -4,7 +4,7 @@ from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.utils.decorators import method_decorator
 from django.utils import timezone
 from django.views import View
@@ -39,7 +39,7 @@ import requests
 
 from jira import JIRA, JIRAError
 
-from search_util.search_helper import return_text_search
+from search_util.search_helper import SEARCH_CATEGORIES, normalise_query, return_category_search, return_text_search
 from tantalus.utils import read_excel_sheets
 from tantalus.settings import STATIC_ROOT, JIRA_URL, LOGIN_URL
 from misc.helpers import Render
@@ -56,7 +56,7 @@ class SearchView(TemplateView):
 
     def get_context_data(self):
 
-        query_str = self.request.GET.get('query_str')
+        query_str = normalise_query(self.request.GET.get('query_str', ''))
 
         if len(query_str) < 1:
             return {"total" : 0}
@@ -64,6 +64,30 @@ class SearchView(TemplateView):
         return return_text_search(query_str)
 
 
+class SearchCategoryJSON(View):
+    """
+    Further pages of the results of one search category, loaded from the
+    search page as the user asks for more.
+    """
+
+    def get(self, request):
+        query_str = normalise_query(request.GET.get('query_str', ''))
+        category = request.GET.get('category')
+
+        if category not in SEARCH_CATEGORIES:
+            raise Http404('unknown search category {}'.format(category))
+
+        try:
+            offset = max(int(request.GET.get('offset', 0)), 0)
+        except ValueError:
+            offset = 0
+
+        if len(query_str) < 1:
+            return JsonResponse({'results': [], 'count': 0, 'next_offset': None})
+
+        return JsonResponse(return_category_search(category, query_str, offset))
+
+
 class ExternalIDSearch(LoginRequiredMixin, TemplateView):
     login_url = LOGIN_URL
 
@@ -1198,17 +1222,19 @@ class ResultJSON(BaseDatatableView):
         search = self.request.GET.get('search[value]', None)
         if search:
             search_list = search.split(" ")
+            # Substring matches cover the prefix matches, and each field
+            # is matched through its own index so no distinct is needed
+            sample_match = self.model.objects.filter(samples__sample_id__in=search_list)
             qs =  qs.filter(reduce(operator.and_,[
-                                         Q(analysis__name__istartswith=key)|Q(id__istartswith=key)|Q(name__istartswith=key)
-                             |Q(results_type__istartswith=key)|Q(libraries__library_id__istartswith=key)
-                             |Q(results_version__istartswith=key)|Q(owner__username__istartswith=key)|Q(samples__sample_id__istartswith=key)
-                             |Q(analysis__name__icontains=key)|Q(id__icontains=key)|Q(name__icontains=key)|Q(results_type__icontains=key)
-                             |Q(libraries__library_id__icontains=key)|Q(results_version__icontains=key)|Q(owner__username__icontains=key)
-                             |Q(samples__sample_id__icontains=key)|Q(samples__sample_id__in=search_list) for key in search_list if key is not ""]
+                             tantalus.models.trigram_search(self.model, [
+                                 'analysis__name', 'name', 'results_type', 'libraries__library_id',
+                                 'results_version', 'owner__username', 'samples__sample_id'], key,
+                                 extra_queries=[sample_match])
+                             for key in search_list if key != ""]
                                    )
                             )
 
-            return qs.distinct()
+            return qs
 
         return qs
 
@@ -1238,10 +1264,8 @@ class AnalysesJSON(BaseDatatableView):
     def filter_queryset(self, qs):
         search = self.request.GET.get('search[value]', None)
         if search:
-            return qs.filter(Q(id__istartswith=search)|Q(name__istartswith=search)|Q(version__istartswith=search)|Q(analysis_type__name__istartswith=search)
-                             |Q(jira_ticket__istartswith=search)|Q(status__istartswith=search)|Q(id__icontains=search)|Q(name__icontains=search)
-                             |Q(version__icontains=search)|Q(analysis_type__name__icontains=search)|Q(jira_ticket__icontains=search)|Q(status__icontains=search)
-                             | Q(owner__username__icontains=search)|Q(owner__username__istartswith=search)).distinct()
+            return qs.filter(tantalus.models.trigram_search(self.model, [
+                                 'name', 'version', 'analysis_type__name', 'jira_ticket', 'status', 'owner__username'], search))
         return qs
 
 
@@ -1282,7 +1306,7 @@ class FileResourceJSON(BaseDatatableView):
     def filter_queryset(self, qs):
         search = self.request.GET.get('search[value]', None)
         if search:
-            return qs.filter(Q(id__startswith=search)|Q(filename__istartswith=search)|Q(filename__icontains=search)).distinct()
+            return qs.filter(tantalus.models.trigram_search(self.model, ['filename'], search))
         return qs
 
 
@@ -1342,7 +1366,8 @@ class DatasetListJSON(LoginRequiredMixin, BaseDatatableView):
             qs = tantalus.models.SequenceDataset.objects.all()
         qs = qs.annotate(
             library_type=F('library__library_type__name'),
-            num_read_groups=Count('sequence_lanes', distinct=True),
+            num_read_groups=F('num_sequence_lanes'),
+            num_total_read_groups=F('num_total_sequence_lanes'),
             annotate_library_id=F('library__library_id'),
             annotate_sample_id=F('sample__sample_id')
         )
@@ -1375,10 +1400,10 @@ class DatasetListJSON(LoginRequiredMixin, BaseDatatableView):
             return row.is_production
 
         if column == 'num_total_read_groups':
-            return row.get_num_total_sequencing_lanes()
+            return row.num_total_read_groups
 
         if column == 'is_complete':
-            return row.get_is_complete()
+            return row.is_complete
 
         else:
             return super(DatasetListJSON, self).render_column(row, column)
@@ -1386,15 +1411,13 @@ class DatasetListJSON(LoginRequiredMixin, BaseDatatableView):
     def filter_queryset(self, qs):
         search = self.request.GET.get('search[value]', None)
         if search:
-            return qs.filter(
-                Q(id__startswith=search) |
-                Q(dataset_type__startswith=search) |
-                Q(annotate_sample_id__startswith=search) |
-                Q(annotate_library_id__startswith=search) |
-                Q(library_type__startswith=search) |
-                Q(dataset_type__startswith=search) |
-                Q(tags__name__startswith=search)
-            ).distinct()
+            return qs.filter(tantalus.models.trigram_search(self.model, [
+                'dataset_type',
+                'sample__sample_id',
+                'library__library_id',
+                'library__library_type__name',
+                'tags__name',
+            ], search, lookup='trigram_startswith'))
         return qs
 
 